@@ -0,0 +1,93 @@
+"""Content-addressed storage for uploaded images.
+
+Blobs are keyed by the SHA-256 of their bytes: identical uploads share one
+copy, and a key always names the same bytes, so responses for it can be
+cached forever. Only the hex key is stored in the database.
+
+The local filesystem backend is the only one so far.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+BLOB_BACKEND = os.environ.get("BLOB_BACKEND", "local").lower()
+BLOB_DIR = os.environ.get("BLOB_DIR") or str(Path(__file__).resolve().parent / "blobs")
+
+if BLOB_BACKEND != "local":
+    raise RuntimeError(f"Unknown BLOB_BACKEND: {BLOB_BACKEND!r}")
+
+_KEY_RE = re.compile(r"[0-9a-f]{64}")
+
+# Leading bytes of the image formats browsers upload, checked in order
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+def blob_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_blob_key(key: str) -> bool:
+    return _KEY_RE.fullmatch(key) is not None
+
+
+def sniff_media_type(head: bytes) -> str:
+    """Media type of a blob from its first bytes (at least 12)."""
+    for signature, media_type in _SIGNATURES:
+        if head.startswith(signature):
+            return media_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class LocalBlobStore:
+    """Blobs as files under `root`, fanned out by the first two hex digits."""
+
+    def __init__(self, root: str) -> None:
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        if not is_blob_key(key):
+            raise ValueError(f"Not a blob key: {key!r}")
+        return self.root / key[:2] / key
+
+    def put(self, data: bytes) -> str:
+        """Store `data` if it is not stored yet and return its key."""
+        key = blob_key(data)
+        path = self._path(key)
+        if path.exists():
+            return key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so readers never see a partial blob
+        tmp = path.with_name(f".{key}.{uuid.uuid4().hex}.tmp")
+        try:
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        return key
+
+    def exists(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """A readable binary stream of the blob, or None if there is none.
+        The caller closes it."""
+        try:
+            return self._path(key).open("rb")
+        except FileNotFoundError:
+            return None
+
+
+blob_store = LocalBlobStore(BLOB_DIR)
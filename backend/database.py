@@ -1,21 +1,169 @@
 """Database engine, session factory, and FastAPI dependency."""
 
 import os
+import threading
+import time
+import uuid
 from pathlib import Path
 
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 
 # Load .env.local from the project root (one level up from backend/)
 load_dotenv(Path(__file__).resolve().parent.parent / ".env.local")
 
 DATABASE_URL = os.environ["DATABASE_URL"]
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# Pool settings. DB_POOL_SIZE=0 turns client-side pooling off (NullPool), which
+# suits a server-side pooler. DB_POOLER=pgbouncer is for transaction-mode
+# poolers such as PgBouncer or Neon's "-pooler" endpoint.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "-1"))  # seconds; -1 never recycles
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOLER = os.environ.get("DB_POOLER", "none").lower()  # "none" or "pgbouncer"
+
+if DB_POOLER not in ("none", "pgbouncer"):
+    raise RuntimeError(f"Unknown DB_POOLER: {DB_POOLER!r}")
+
+
+class PoolStats:
+    """Checkout counters for one pool class, kept across pool re-creation."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, waited: float, timed_out: bool) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def record_error(self) -> None:
+        """A checkout that failed for another reason, e.g. a refused connection."""
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "avgWaitMs": round(1000 * self.total_wait / self.checkouts, 3) if self.checkouts else 0.0,
+                "maxWaitMs": round(1000 * self.max_wait, 3),
+            }
+
+
+class _MeteredPoolMixin:
+    """Times how long each checkout waits for a connection, including the
+    time to open a new one."""
+
+    stats: PoolStats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        except Exception:
+            self.stats.record_error()
+            raise
+        self.stats.record(time.perf_counter() - start, timed_out=False)
+        return conn
+
+
+class MeteredQueuePool(_MeteredPoolMixin, QueuePool):
+    stats = PoolStats()
+
+
+class MeteredAsyncAdaptedQueuePool(_MeteredPoolMixin, AsyncAdaptedQueuePool):
+    stats = PoolStats()
+
+
+def _pool_options(poolclass: type) -> dict:
+    if DB_POOL_SIZE <= 0:
+        return {"poolclass": NullPool, "pool_pre_ping": DB_POOL_PRE_PING}
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+engine = create_engine(DATABASE_URL, **_pool_options(MeteredQueuePool))
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
 
+def _async_database_url(url: str) -> URL:
+    """Point a Postgres URL at asyncpg, which spells libpq's `sslmode` as `ssl`
+    and has no `channel_binding` option."""
+    u = make_url(url)
+    if u.get_backend_name() != "postgresql":
+        return u
+    query = dict(u.query)
+    if "sslmode" in query:
+        query["ssl"] = query.pop("sslmode")
+    query.pop("channel_binding", None)
+    return u.set(drivername="postgresql+asyncpg", query=query)
+
+
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL") or _async_database_url(DATABASE_URL)
+
+_async_connect_args = {}
+if DB_POOLER == "pgbouncer":
+    # Transaction-mode poolers hand each transaction a different server
+    # connection, so asyncpg must not cache or reuse named prepared statements
+    _async_connect_args = {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4().hex}__",
+    }
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, connect_args=_async_connect_args, **_pool_options(MeteredAsyncAdaptedQueuePool)
+)
+# Objects stay loaded after commit: lazy refreshes cannot run implicitly under asyncio
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
+def pool_status(pool) -> dict:
+    """Current occupancy and lifetime checkout stats of an engine's pool."""
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    status = {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "maxOverflow": DB_MAX_OVERFLOW,
+        "checkedIn": pool.checkedin(),
+        "checkedOut": pool.checkedout(),
+        # Negative while the pool has not yet opened `size` connections
+        "overflow": pool.overflow(),
+    }
+    if isinstance(pool, _MeteredPoolMixin):
+        status.update(pool.stats.snapshot())
+    return status
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -27,3 +175,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """FastAPI dependency that yields an AsyncSession for `async def` endpoints."""
+    async with AsyncSessionLocal() as db:
+        yield db
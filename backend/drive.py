@@ -0,0 +1,218 @@
+"""Copies of quest photos in the uploader's Google Drive.
+
+The API queues uploads in drive_upload_jobs and background tasks hand them
+to `drive_uploader` (see main.run_drive_upload_job). DRIVE_BACKEND=fake
+swaps Google for a local directory, for tests and offline development.
+"""
+
+from __future__ import annotations
+
+import functools
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from google.auth.exceptions import RefreshError
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaInMemoryUpload
+
+from blobstore import sniff_media_type
+
+DRIVE_BACKEND = os.environ.get("DRIVE_BACKEND", "google").lower()
+DRIVE_FAKE_DIR = os.environ.get("DRIVE_FAKE_DIR") or str(Path(__file__).resolve().parent / "drive_fake")
+DRIVE_CLIENT_TTL = float(os.environ.get("DRIVE_CLIENT_TTL", "1800"))  # seconds a user's Drive client is reused
+DRIVE_CLIENT_CACHE_SIZE = int(os.environ.get("DRIVE_CLIENT_CACHE_SIZE", "256"))  # users with a cached client
+DRIVE_FOLDER_NAME = "BuddyBeasts"
+
+# Drive answers these when the caller should slow down and try again
+_RETRYABLE_STATUSES = {408, 429}
+# ...and 403 with one of these reasons; other 403s (no access, quota full) are final
+_RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+
+class PermanentUploadError(Exception):
+    """An upload that would fail the same way if retried (e.g. revoked access)."""
+
+
+class DriveUploader(ABC):
+    """A Drive backend: GoogleDriveUploader or FakeDriveUploader."""
+
+    @abstractmethod
+    def upload(self, user_id: str, refresh_token: Optional[str], data: bytes, filename: str) -> str:
+        """Upload an image and return a publicly viewable URL. Raises
+        PermanentUploadError when retrying cannot help; anything else is retried."""
+
+
+def _error_reasons(exc: HttpError) -> set[str]:
+    """The `reason` of each error in a Drive error response body."""
+    try:
+        errors = json.loads(exc.content)["error"]["errors"]
+        return {e["reason"] for e in errors}
+    except (ValueError, KeyError, TypeError):
+        return set()
+
+
+def _is_retryable(exc: HttpError) -> bool:
+    status = exc.resp.status
+    if status >= 500 or status in _RETRYABLE_STATUSES:
+        return True
+    return status == 403 and bool(_error_reasons(exc) & _RATE_LIMIT_REASONS)
+
+
+@functools.cache
+def _discovery_document() -> str:
+    """The Drive v3 discovery document bundled with the client library, read
+    once. Kept as JSON text: the library annotates a parsed document in place
+    while it builds requests, so one dict can't be shared between services."""
+    return get_static_doc("drive", "v3")
+
+
+class _DriveClient:
+    """An authorized Drive service for one user, plus their folder id once
+    known. httplib2 connections are not thread-safe, so calls through one
+    client hold its lock."""
+
+    def __init__(self, service, refresh_token: str, expires_at: float) -> None:
+        self.service = service
+        self.refresh_token = refresh_token
+        self.expires_at = expires_at
+        self.folder_id: Optional[str] = None
+        self.lock = threading.Lock()
+
+
+class GoogleDriveUploader(DriveUploader):
+    """Uploads into a 'BuddyBeasts' folder in the user's own Drive.
+
+    Each user's service (with its access token) and folder id are cached for
+    `ttl` seconds, at most `max_size` users, least recently used evicted
+    first. A cached upload is then two API calls instead of a token refresh,
+    a folder search, the upload and the permission.
+    """
+
+    def __init__(self, client_id: str, client_secret: str, ttl: float, max_size: int) -> None:
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clients: OrderedDict[str, _DriveClient] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def upload(self, user_id: str, refresh_token: Optional[str], data: bytes, filename: str) -> str:
+        if not refresh_token:
+            raise PermanentUploadError("No Google refresh token for this user")
+        try:
+            return self._upload(self._client(user_id, refresh_token), data, filename)
+        except RefreshError as exc:
+            self.forget(user_id)
+            if exc.retryable:
+                raise
+            raise PermanentUploadError(f"Google refused the refresh token: {exc}") from exc
+        except HttpError as exc:
+            if not _is_retryable(exc):
+                raise PermanentUploadError(f"Drive rejected the upload: {exc}") from exc
+            raise
+
+    def forget(self, user_id: str) -> None:
+        with self._lock:
+            self._clients.pop(user_id, None)
+
+    def _client(self, user_id: str, refresh_token: str) -> _DriveClient:
+        now = time.monotonic()
+        with self._lock:
+            client = self._clients.get(user_id)
+            # A new refresh token (the user signed in again) replaces the client
+            if client is not None and client.refresh_token == refresh_token and client.expires_at > now:
+                self._clients.move_to_end(user_id)
+                return client
+            client = _DriveClient(self._build_service(refresh_token), refresh_token, now + self.ttl)
+            if self.ttl > 0 and self.max_size > 0:
+                self._clients[user_id] = client
+                self._clients.move_to_end(user_id)
+                while len(self._clients) > self.max_size:
+                    self._clients.popitem(last=False)
+            return client
+
+    def _build_service(self, refresh_token: str):
+        creds = Credentials(
+            token=None,
+            refresh_token=refresh_token,
+            token_uri="https://oauth2.googleapis.com/token",
+            client_id=self.client_id,
+            client_secret=self.client_secret,
+        )
+        return build_from_document(_discovery_document(), credentials=creds)
+
+    def _upload(self, client: _DriveClient, data: bytes, filename: str) -> str:
+        with client.lock:
+            if client.folder_id is None:
+                client.folder_id = self._find_or_create_folder(client.service)
+            try:
+                file_id = self._create_file(client.service, client.folder_id, data, filename)
+            except HttpError as exc:
+                if exc.resp.status != 404:
+                    raise
+                # The cached folder was deleted since; look it up again
+                client.folder_id = self._find_or_create_folder(client.service)
+                file_id = self._create_file(client.service, client.folder_id, data, filename)
+
+            # Make publicly viewable
+            client.service.permissions().create(
+                fileId=file_id,
+                body={"role": "reader", "type": "anyone"},
+            ).execute()
+
+        return f"https://drive.google.com/thumbnail?id={file_id}&sz=w1000"
+
+    @staticmethod
+    def _find_or_create_folder(service) -> str:
+        query = f"name='{DRIVE_FOLDER_NAME}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
+        results = service.files().list(q=query, spaces="drive", fields="files(id)").execute()
+        folders = results.get("files", [])
+        if folders:
+            return folders[0]["id"]
+        folder_meta = {
+            "name": DRIVE_FOLDER_NAME,
+            "mimeType": "application/vnd.google-apps.folder",
+        }
+        return service.files().create(body=folder_meta, fields="id").execute()["id"]
+
+    @staticmethod
+    def _create_file(service, folder_id: str, data: bytes, filename: str) -> str:
+        file_meta = {"name": filename, "parents": [folder_id]}
+        media = MediaInMemoryUpload(data, mimetype=sniff_media_type(data[:12]))
+        return service.files().create(body=file_meta, media_body=media, fields="id").execute()["id"]
+
+
+class FakeDriveUploader(DriveUploader):
+    """Writes uploads to root/<user_id>/<filename> and returns file:// URLs.
+    Needs no Google account, so it accepts users without a refresh token."""
+
+    def __init__(self, root: str) -> None:
+        self.root = Path(root)
+
+    def upload(self, user_id: str, refresh_token: Optional[str], data: bytes, filename: str) -> str:
+        path = self.root / user_id / Path(filename).name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        return path.resolve().as_uri()
+
+
+if DRIVE_BACKEND == "google":
+    drive_uploader: DriveUploader = GoogleDriveUploader(
+        os.environ.get("VITE_GOOGLE_CLIENT_ID", ""),
+        os.environ.get("GOOGLE_CLIENT_SECRET", ""),
+        DRIVE_CLIENT_TTL,
+        DRIVE_CLIENT_CACHE_SIZE,
+    )
+elif DRIVE_BACKEND == "fake":
+    drive_uploader = FakeDriveUploader(DRIVE_FAKE_DIR)
+else:
+    raise RuntimeError(f"Unknown DRIVE_BACKEND: {DRIVE_BACKEND!r}")
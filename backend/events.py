@@ -0,0 +1,272 @@
+"""In-process pub/sub event bus with pluggable backends.
+
+Endpoints publish small JSON payloads on dotted topics and push transports
+(WebSockets, SSE) subscribe to them. The memory backend fans out within a
+single process; the Postgres backend rides LISTEN/NOTIFY so that several
+uvicorn workers see each other's events.
+
+Payloads should carry ids and a few fields, not whole rows: NOTIFY caps a
+payload at 8000 bytes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import select
+import threading
+from collections.abc import AsyncIterator, Iterable
+from dataclasses import dataclass
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from database import DATABASE_URL, engine
+
+logger = logging.getLogger("gatherlings.events")
+
+# ── Topics ───────────────────────────────────────────────────────────────────
+
+CHAT_MESSAGE = "chat.message"  # prefix; messages go out on chat_topic(lobby_id)
+LOBBY_UPDATED = "lobby.updated"
+LOBBY_EMOTE = "lobby.emote"
+HUB_PRESENCE = "hub.presence"
+HUB_PRESENCE_SYNC = "hub.presence_sync"
+NOTIFICATION_CREATED = "notification.created"
+SESSION_INVALIDATED = "session.invalidated"
+DRIVE_UPLOAD_QUEUED = "drive.upload_queued"
+
+NOTIFY_CHANNEL = "gatherlings_events"
+MAX_NOTIFY_BYTES = 7900  # Postgres rejects NOTIFY payloads of 8000 bytes or more
+
+
+def chat_topic(lobby_id: str) -> str:
+    """Per-lobby chat topic, so a chat stream only wakes for its own lobby."""
+    return f"{CHAT_MESSAGE}.{lobby_id}"
+
+
+@dataclass(frozen=True)
+class Event:
+    topic: str
+    payload: dict
+
+
+class Subscription:
+    """A bounded queue of events for one consumer.
+
+    When a slow consumer falls behind, the oldest queued event is dropped so
+    publishers never block.
+    """
+
+    def __init__(self, bus: EventBus, topics: Iterable[str], maxsize: int = 256) -> None:
+        self._bus = bus
+        self.topics = frozenset(topics)
+        self._queue: asyncio.Queue[Event] = asyncio.Queue(maxsize=maxsize)
+
+    def _offer(self, event: Event) -> None:
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(event)
+
+    async def get(self) -> Event:
+        return await self._queue.get()
+
+    def close(self) -> None:
+        self._bus._remove(self)
+
+    def __aiter__(self) -> AsyncIterator[Event]:
+        return self
+
+    async def __anext__(self) -> Event:
+        return await self.get()
+
+    def __enter__(self) -> Subscription:
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
+
+
+class EventBus:
+    """Base bus with in-memory fan-out; subclasses change how events travel.
+
+    `publish` is synchronous and thread-safe so the plain `def` endpoints,
+    which run in the threadpool, can call it directly. Subscriptions must be
+    created on the event loop the bus was started on.
+    """
+
+    def __init__(self) -> None:
+        # topic -> subscriptions, so an event only reaches the consumers of its topic
+        self._subscriptions: dict[str, set[Subscription]] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+
+    async def stop(self) -> None:
+        self._loop = None
+
+    def subscribe(self, *topics: str, maxsize: int = 256) -> Subscription:
+        sub = Subscription(self, topics, maxsize=maxsize)
+        for topic in sub.topics:
+            self._subscriptions.setdefault(topic, set()).add(sub)
+        return sub
+
+    def _remove(self, sub: Subscription) -> None:
+        for topic in sub.topics:
+            subs = self._subscriptions.get(topic)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscriptions[topic]
+
+    def publish(self, topic: str, payload: dict) -> None:
+        """Publish an event. Failures are logged, never raised: the caller's
+        write has already committed and must not turn into an error response."""
+        try:
+            self._send(Event(topic, payload))
+        except Exception:
+            logger.exception("Failed to publish %s event", topic)
+
+    def _send(self, event: Event) -> None:
+        self._deliver(event)
+
+    def _deliver(self, event: Event) -> None:
+        """Hand an event to local subscribers from any thread."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._dispatch, event)
+
+    def _dispatch(self, event: Event) -> None:
+        for sub in list(self._subscriptions.get(event.topic, ())):
+            sub._offer(event)
+
+
+class MemoryEventBus(EventBus):
+    """Single-process bus: events never leave this worker."""
+
+
+class PostgresEventBus(EventBus):
+    """Multi-worker bus over Postgres LISTEN/NOTIFY.
+
+    Publishing only queues the message: a sender thread issues the
+    `pg_notify`s, batching whatever queued up meanwhile into one transaction,
+    so `async def` endpoints can publish without blocking the event loop. A
+    dedicated listener thread holds its own connection (outside the
+    SQLAlchemy pool) and feeds every NOTIFY, including this worker's own, to
+    local subscribers.
+    """
+
+    def __init__(self, dsn: str, channel: str = NOTIFY_CHANNEL) -> None:
+        super().__init__()
+        self._dsn = dsn
+        self._channel = channel
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._outbox: queue.SimpleQueue[str | None] = queue.SimpleQueue()
+        self._sender: threading.Thread | None = None
+
+    async def start(self) -> None:
+        await super().start()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._listen_forever, name="event-bus-listener", daemon=True)
+        self._thread.start()
+        self._sender = threading.Thread(target=self._send_forever, name="event-bus-sender", daemon=True)
+        self._sender.start()
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        sender, self._sender = self._sender, None
+        if sender is not None:
+            # Later publishes go out inline; flush what is already queued
+            self._outbox.put(None)
+            await asyncio.to_thread(sender.join, 5)
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join, 5)
+            self._thread = None
+        await super().stop()
+
+    def _send(self, event: Event) -> None:
+        message = json.dumps(
+            {"topic": event.topic, "payload": event.payload}, separators=(",", ":"), ensure_ascii=False
+        )
+        if len(message.encode()) > MAX_NOTIFY_BYTES:
+            raise ValueError(f"Event payload for {event.topic!r} exceeds {MAX_NOTIFY_BYTES} bytes")
+        if self._sender is None:
+            # Not started (scripts, shutdown): nobody would drain the queue
+            self._notify([message])
+        else:
+            self._outbox.put(message)
+
+    def _notify(self, messages: list[str]) -> None:
+        with engine.connect() as conn:
+            for message in messages:
+                conn.execute(text("SELECT pg_notify(:channel, :message)"), {"channel": self._channel, "message": message})
+            conn.commit()
+
+    def _send_forever(self) -> None:
+        while True:
+            batch = [self._outbox.get()]
+            while len(batch) < 100:
+                try:
+                    batch.append(self._outbox.get_nowait())
+                except queue.Empty:
+                    break
+            done = None in batch
+            messages = [m for m in batch if m is not None]
+            if messages:
+                try:
+                    self._notify(messages)
+                except Exception:
+                    logger.exception("Failed to publish %d events", len(messages))
+            if done:
+                return
+
+    def _listen_forever(self) -> None:
+        import psycopg2
+        import psycopg2.extensions
+
+        backoff = 1.0
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self._dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f'LISTEN "{self._channel}"')
+                backoff = 1.0
+                while not self._stopping.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        data = json.loads(notify.payload)
+                        self._deliver(Event(data["topic"], data["payload"]))
+            except Exception:
+                logger.exception("Event bus listener lost its connection; retrying in %.0fs", backoff)
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+def create_event_bus() -> EventBus:
+    """Build the bus selected by EVENT_BUS_BACKEND (`memory` or `postgres`)."""
+    backend = os.environ.get("EVENT_BUS_BACKEND", "memory").lower()
+    if backend == "memory":
+        return MemoryEventBus()
+    if backend == "postgres":
+        # LISTEN needs a session-level connection, which transaction-mode poolers do not keep
+        url = os.environ.get("EVENT_BUS_DATABASE_URL") or DATABASE_URL
+        dsn = make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+        return PostgresEventBus(dsn)
+    raise ValueError(f"Unknown EVENT_BUS_BACKEND: {backend!r}")
+
+
+event_bus = create_event_bus()
@@ -9,32 +9,98 @@ from __future__ import annotations
 
 import asyncio
 import base64
+import hashlib
+import hmac
+import json
+import logging
 import math
+import multiprocessing
 import os
 import random
 import secrets
+import threading
 import time
 import uuid
+from collections import OrderedDict
 from collections.abc import AsyncIterator
+from concurrent.futures import Future, ProcessPoolExecutor, wait
 from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Optional
 
 import httpx
-from fastapi import Depends, FastAPI, Header, HTTPException, Query
+import numpy as np
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaInMemoryUpload
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from jose import JWTError, jwt as jose_jwt
 from pydantic import BaseModel, Field
-from sqlalchemy import func
-from sqlalchemy.orm import Session
-
-from database import Base, engine, get_db
+from sqlalchemy import (
+    JSON, DateTime, Float, Integer, String, and_, any_, cast, column, delete, func, insert, or_, select, text, true,
+    tuple_, union, update, values,
+)
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, defer
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.orm.attributes import set_committed_value
+
+from blobstore import blob_store, is_blob_key, sniff_media_type
+from database import AsyncSessionLocal, Base, SessionLocal, async_engine, engine, get_async_db, get_db, pool_status
+from drive import PermanentUploadError, drive_uploader
+from events import event_bus
+from presence import presence_store
+from recommender import QuestTypeModel
+from spatial import GeoIndex
+from thumbnails import UnusableImage, render_thumbnails
+import events
 import models
 
 GOOGLE_CLIENT_ID = os.environ.get("VITE_GOOGLE_CLIENT_ID", "")
 GOOGLE_CLIENT_SECRET = os.environ.get("GOOGLE_CLIENT_SECRET", "")
+EXPIRY_SWEEP_INTERVAL = float(os.environ.get("EXPIRY_SWEEP_INTERVAL", "30"))  # seconds
+CHAT_STREAM_KEEPALIVE = 15  # seconds between SSE keep-alive comments
+CHAT_PAGE_DEFAULT = 50
+CHAT_PAGE_MAX = 200
+DM_INBOX_PAGE_DEFAULT = 30
+DM_INBOX_PAGE_MAX = 100
+GALLERY_PAGE_DEFAULT = 30
+GALLERY_PAGE_MAX = 100
+SESSION_CACHE_TTL = float(os.environ.get("SESSION_CACHE_TTL", "60"))  # seconds
+SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", "10000"))
+SESSION_TOKEN_MODE = os.environ.get("SESSION_TOKEN_MODE", "opaque").lower()  # "opaque" or "signed"
+SESSION_SECRET = os.environ.get("SESSION_SECRET", "")
+SESSION_TTL = float(os.environ.get("SESSION_TTL", str(30 * 24 * 3600)))  # seconds
+SESSION_PURGE_INTERVAL = float(os.environ.get("SESSION_PURGE_INTERVAL", "3600"))  # seconds
+PRESENCE_FLUSH_INTERVAL = float(os.environ.get("PRESENCE_FLUSH_INTERVAL", "10"))  # seconds
+HUB_DIRECTORY_TTL = float(os.environ.get("HUB_DIRECTORY_TTL", "60"))  # seconds
+HUB_SPATIAL_INDEX = os.environ.get("HUB_SPATIAL_INDEX", "memory").lower()  # "memory" or "earthdistance"
+BLOB_STREAM_CHUNK = 64 * 1024
+THUMBNAIL_WORKERS = int(os.environ.get("THUMBNAIL_WORKERS", "2"))  # processes rendering photo thumbnails
+GALLERY_THUMB_WIDTH = 640  # default display width, in device pixels, a photo's thumbUrl must cover
+PHOTO_URL_SECRET = os.environ.get("PHOTO_URL_SECRET", "")  # HMAC key for photo and blob links
+PHOTO_URL_TTL = int(os.environ.get("PHOTO_URL_TTL", "3600"))  # seconds a photo image link stays valid, at least
+DRIVE_UPLOAD_WORKERS = int(os.environ.get("DRIVE_UPLOAD_WORKERS", "2"))  # concurrent Drive uploads per process
+DRIVE_UPLOAD_MAX_ATTEMPTS = int(os.environ.get("DRIVE_UPLOAD_MAX_ATTEMPTS", "8"))
+DRIVE_RETRY_BASE_DELAY = float(os.environ.get("DRIVE_RETRY_BASE_DELAY", "30"))  # seconds, doubled per attempt
+DRIVE_RETRY_MAX_DELAY = float(os.environ.get("DRIVE_RETRY_MAX_DELAY", "3600"))  # seconds
+DRIVE_UPLOAD_POLL_INTERVAL = float(os.environ.get("DRIVE_UPLOAD_POLL_INTERVAL", "15"))  # seconds
+DRIVE_UPLOAD_LEASE = 300  # seconds a claimed job stays hidden from other workers
+CF_MODEL_TTL = float(os.environ.get("CF_MODEL_TTL", "300"))  # seconds before re-reading trained embeddings
+WORKER_ID = uuid.uuid4().hex  # identifies this process as the holder of job_leases rows
+STARTUP_DDL_LOCK = 0x73636865  # advisory lock key serializing startup schema changes across workers
+STARTUP_INDEX_MAX_BYTES = 16 * 1024 * 1024  # bigger tables get new indexes from the migrations instead
+PRESENCE_SYNC_CHUNK = 80  # heartbeats per hub.presence_sync event, to stay under the NOTIFY limit
+
+if SESSION_TOKEN_MODE not in ("opaque", "signed"):
+    raise RuntimeError(f"Unknown SESSION_TOKEN_MODE: {SESSION_TOKEN_MODE!r}")
+if SESSION_TOKEN_MODE == "signed" and not SESSION_SECRET:
+    raise RuntimeError("SESSION_TOKEN_MODE=signed requires SESSION_SECRET")
+if not PHOTO_URL_SECRET:
+    raise RuntimeError("PHOTO_URL_SECRET must be set")
+
+logger = logging.getLogger("gatherlings")
 
 
 # ── Seed Data ────────────────────────────────────────────────────────────────
@@ -472,17 +538,53 @@ QUEST_TRAIT_SCORES = {
     "pottery":        {"curious": 7, "social": 5, "creative": 10, "adventurous": 3, "calm": 7},
 }
 
+TRAIT_KEYS = ("curious", "social", "creative", "adventurous", "calm")
+# Row i of QUEST_TRAIT_MATRIX holds the scores of QUEST_TRAIT_TYPES[i], in TRAIT_KEYS order
+QUEST_TRAIT_TYPES = list(QUEST_TRAIT_SCORES)
+QUEST_TRAIT_INDEX = {quest_type: i for i, quest_type in enumerate(QUEST_TRAIT_TYPES)}
+QUEST_TRAIT_MATRIX = np.array(
+    [[QUEST_TRAIT_SCORES[t].get(k, 5) for k in TRAIT_KEYS] for t in QUEST_TRAIT_TYPES], dtype=np.float64
+)
+
 
 # ── Helpers ──────────────────────────────────────────────────────────────────
 
-def compute_trait_distance(user_traits: dict, quest_type: str) -> float:
-    """Euclidean distance between user trait scores and a quest type's trait scores.
-    Returns -1 if the quest type is not in QUEST_TRAIT_SCORES."""
-    quest_traits = QUEST_TRAIT_SCORES.get(quest_type)
-    if not quest_traits:
-        return -1.0
-    keys = ["curious", "social", "creative", "adventurous", "calm"]
-    return math.sqrt(sum((user_traits.get(k, 5) - quest_traits.get(k, 5)) ** 2 for k in keys))
+def quest_type_distances(user_traits: dict) -> np.ndarray:
+    """Euclidean distance from the user's trait scores to every quest type,
+    indexed like QUEST_TRAIT_TYPES. Missing user traits count as 5."""
+    user_vec = np.array([user_traits.get(k, 5) for k in TRAIT_KEYS], dtype=np.float64)
+    return np.linalg.norm(QUEST_TRAIT_MATRIX - user_vec, axis=1)
+
+
+def _k_smallest(keys: np.ndarray, k: int, late_ties_first: bool = False) -> np.ndarray:
+    """Positions of the `k` smallest keys, smallest first. Ties go to the
+    earliest positions, or the latest with `late_ties_first`.
+
+    `argpartition` finds the k-th key in O(n), so only the k picked entries
+    are ever sorted.
+    """
+    k = min(k, len(keys))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    kth = keys[np.argpartition(keys, k - 1)[k - 1]]
+    below = np.flatnonzero(keys < kth)
+    ties = np.flatnonzero(keys == kth)
+    if late_ties_first:
+        ties = ties[::-1]
+    picked = np.concatenate((below, ties[: k - len(below)]))
+    tie_order = -picked if late_ties_first else picked
+    return picked[np.lexsort((tie_order, keys[picked]))]
+
+
+def nearest_and_farthest(dist: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Positions of the `k` smallest distances and of the `k` largest among
+    the rest. The order matches a stable ascending sort read from the front
+    and, for the farthest, from the back."""
+    near = _k_smallest(dist, k)
+    remaining = -dist
+    remaining[near] = np.inf
+    far = _k_smallest(remaining, min(k, len(dist) - len(near)), late_ties_first=True)
+    return near, far
 
 
 def haversine(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
@@ -504,10 +606,122 @@ def compute_level(crystals: int) -> int:
     return math.floor(crystals / 100) + 1
 
 
+def compute_level_sql(crystals):
+    """compute_level as a SQL expression (integer division of non-negative crystals)."""
+    return crystals // 100 + 1
+
+
+def json_increment(counts_column, key: str):
+    """SQL for a JSON object of counters with `key` incremented by one."""
+    counts = func.coalesce(cast(counts_column, JSONB), text("'{}'::jsonb"))
+    bumped = counts.op("||")(func.jsonb_build_object(key, func.coalesce(counts[key].astext.cast(Integer), 0) + 1))
+    return cast(bumped, JSON)
+
+
+def lock_rows_in_order(db: Session, key_column, keys: list[str]) -> None:
+    """SELECT ... FOR UPDATE the rows with these keys, in key order.
+
+    A bulk UPDATE locks rows in whatever order its plan visits them, so two
+    completions over overlapping participants can deadlock. Taking the locks
+    in a fixed order first makes the second one wait instead.
+    """
+    db.execute(select(key_column).where(key_column.in_(keys)).order_by(key_column).with_for_update())
+
+
+def settle_quest_rewards(
+    db: Session, user_ids: list[str], quest_type: str, crystals: int, coins: int = 0, social: int = 10
+) -> None:
+    """Credit a completed quest to every participant's monster in one UPDATE.
+
+    Users without a monster are skipped, as before.
+    """
+    lock_rows_in_order(db, models.Monster.user_id, user_ids)
+    db.execute(
+        update(models.Monster)
+        .where(models.Monster.user_id.in_(user_ids))
+        .values(
+            coins=models.Monster.coins + coins,
+            crystals=models.Monster.crystals + crystals,
+            level=compute_level_sql(models.Monster.crystals + crystals),
+            quests_completed=models.Monster.quests_completed + 1,
+            social_score=models.Monster.social_score + social,
+            preferred_quest_types=json_increment(models.Monster.preferred_quest_types, quest_type),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
 def make_token() -> str:
     return secrets.token_urlsafe(32)
 
 
+def parse_start_time(value: Optional[str]) -> Optional[datetime]:
+    """Parse an ISO start time from the client into a naive server-local datetime."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="startTime must be an ISO 8601 datetime")
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+def _expired_instance_clause(now: float, now_dt: datetime):
+    """SQL predicate for instances past their deadline, or past start_time with nobody joined."""
+    return or_(
+        models.QuestInstance.deadline < now,
+        and_(
+            models.QuestInstance.start_time < now_dt,
+            models.QuestInstance.current_participants == 0,
+        ),
+    )
+
+
+def live_instances_query(db: Session, hub_id: Optional[str] = None):
+    """Active, unexpired quest instances (optionally for one hub), without writing anything.
+
+    The inverse of the sweeper's expiry predicate is applied here too, so
+    quests that expire between two sweeper runs are hidden immediately.
+    """
+    now, now_dt = time.time(), datetime.now()
+    q = db.query(models.QuestInstance).filter(
+        models.QuestInstance.is_active == True,
+        or_(models.QuestInstance.deadline == None, models.QuestInstance.deadline >= now),
+        or_(
+            models.QuestInstance.start_time == None,
+            models.QuestInstance.start_time >= now_dt,
+            models.QuestInstance.current_participants > 0,
+        ),
+    )
+    if hub_id:
+        q = q.filter(models.QuestInstance.hub_id == hub_id)
+    return q
+
+
+def scorable_instances(db: Session, hub_id: Optional[str], quest_types: list[str]) -> list[tuple[str, str]]:
+    """(instance_id, quest type) of every live instance whose type is in `quest_types`.
+
+    Recommendation endpoints score these from the type alone and load only
+    the picked instances in full. The rows are read on the raw connection,
+    skipping per-row ORM processing, the bulk of the cost for thousands of quests.
+    """
+    return db.connection().execute(live_instances_query(db, hub_id).join(
+        models.QuestTemplate, models.QuestTemplate.id == models.QuestInstance.template_id
+    ).filter(
+        models.QuestTemplate.type.in_(quest_types)
+    ).with_entities(
+        models.QuestInstance.instance_id, models.QuestTemplate.type
+    ).statement).all()
+
+
+def load_picked_instances(db: Session, instance_ids: list[str]) -> dict[str, dict]:
+    """instance_id -> instance dict for a handful of picked instances."""
+    instances = db.query(models.QuestInstance).filter(models.QuestInstance.instance_id.in_(instance_ids)).all()
+    return {item["instanceId"]: item for item in load_instance_dicts(db, instances)}
+
+
 def monster_to_dict(m: models.Monster) -> dict:
     """Convert a Monster ORM object to the API dict shape."""
     return {
@@ -550,6 +764,17 @@ def hub_to_dict(h: models.Hub, active_users: int = 0, distance: float = 0.0) ->
     }
 
 
+def chat_message_to_dict(r: models.ChatMessage) -> dict:
+    return {
+        "id": r.id,
+        "lobbyId": r.lobby_id,
+        "userId": r.user_id,
+        "userName": r.user_name,
+        "content": r.content,
+        "timestamp": r.timestamp,
+    }
+
+
 def template_to_dict(t: models.QuestTemplate) -> dict:
     return {
         "id": t.id,
@@ -586,12 +811,56 @@ def instance_to_dict(inst: models.QuestInstance, tpl: models.QuestTemplate, part
         "currentParticipants": inst.current_participants,
         "participants": participant_ids,
         "isActive": inst.is_active,
-        "startTime": inst.start_time,
+        "startTime": inst.start_time.isoformat() if inst.start_time else None,
         "location": inst.location or "",
         "deadline": inst.deadline,
     }
 
 
+def load_instance_dicts(db: Session, instances: list[models.QuestInstance]) -> list[dict]:
+    """Serialize a page of quest instances in a fixed number of queries.
+
+    Templates, participant ids and creator names are fetched with one
+    ``IN (...)`` query each rather than three lookups per instance.
+    Instances whose template no longer exists are skipped.
+    """
+    if not instances:
+        return []
+    instance_ids = [inst.instance_id for inst in instances]
+    template_ids = {inst.template_id for inst in instances}
+    creator_ids = {inst.creator_user_id for inst in instances if inst.creator_user_id}
+
+    templates = {
+        t.id: t
+        for t in db.query(models.QuestTemplate).filter(models.QuestTemplate.id.in_(template_ids)).all()
+    }
+
+    participant_map: dict[str, list[str]] = {iid: [] for iid in instance_ids}
+    participant_rows = db.query(
+        models.InstanceParticipant.instance_id, models.InstanceParticipant.user_id
+    ).filter(
+        models.InstanceParticipant.instance_id.in_(instance_ids)
+    ).order_by(models.InstanceParticipant.id).all()
+    for instance_id, user_id in participant_rows:
+        participant_map[instance_id].append(user_id)
+
+    creator_names: dict[str, str] = {}
+    if creator_ids:
+        creator_names = dict(
+            db.query(models.User.id, models.User.name).filter(models.User.id.in_(creator_ids)).all()
+        )
+
+    result = []
+    for inst in instances:
+        tpl = templates.get(inst.template_id)
+        if not tpl:
+            continue
+        result.append(instance_to_dict(
+            inst, tpl, participant_map[inst.instance_id], creator_names.get(inst.creator_user_id)
+        ))
+    return result
+
+
 def ensure_user_stores(db: Session, user_id: str) -> None:
     """Ensure the user has a monster row."""
     existing = db.query(models.Monster).filter(models.Monster.user_id == user_id).first()
@@ -622,32 +891,308 @@ def ensure_user_stores(db: Session, user_id: str) -> None:
 
 # ── Auth Dependency ──────────────────────────────────────────────────────────
 
-def get_current_user(authorization: str = Header(None), db: Session = Depends(get_db)) -> dict:
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class SessionCache:
+    """Bounded TTL/LRU map from session-token hash to the user dict.
+
+    Keyed by hash so raw tokens are never held in memory longer than a
+    request. Entries expire after `ttl` seconds, which also bounds how stale
+    a user's name can be on workers that missed an invalidation.
+    """
+
+    def __init__(self, ttl: float, max_size: int) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def put(self, key: str, user: dict) -> None:
+        if self.ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_user(self, user_id: str) -> None:
+        with self._lock:
+            for key in [k for k, (_, u) in self._entries.items() if u["id"] == user_id]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+session_cache = SessionCache(SESSION_CACHE_TTL, SESSION_CACHE_SIZE)
+
+
+def invalidate_session(token: str) -> None:
+    """Drop a token from this worker's cache and tell the other workers."""
+    key = token_hash(token)
+    session_cache.discard(key)
+    event_bus.publish(events.SESSION_INVALIDATED, {"tokenHash": key})
+
+
+def invalidate_user_sessions(user_id: str) -> None:
+    """Drop every cached session of a user, e.g. after their profile changed."""
+    session_cache.discard_user(user_id)
+    event_bus.publish(events.SESSION_INVALIDATED, {"userId": user_id})
+
+
+async def _run_session_invalidation() -> None:
+    """Apply invalidations published by any worker to this worker's cache."""
+    with event_bus.subscribe(events.SESSION_INVALIDATED) as sub:
+        async for event in sub:
+            if "tokenHash" in event.payload:
+                session_cache.discard(event.payload["tokenHash"])
+            if "userId" in event.payload:
+                session_cache.discard_user(event.payload["userId"])
+            if "jti" in event.payload:
+                _revoked_jtis[event.payload["jti"]] = event.payload["expiresAt"]
+
+
+# jti -> exp of signed tokens that were logged out before they expired
+_revoked_jtis: dict[str, float] = {}
+
+
+def issue_session_token(db: Session, user: models.User) -> str:
+    """Create a session token for a user.
+
+    In signed mode this is an HS256 JWT carrying only the user id, verified
+    without touching the DB; the profile comes from the session cache like
+    an opaque token's, so renames are not frozen into the token. Otherwise
+    it is an opaque token stored in the sessions table. The caller commits.
+    """
+    now = time.time()
+    if SESSION_TOKEN_MODE == "signed":
+        claims = {
+            "sub": user.id,
+            "jti": uuid.uuid4().hex,
+            "iat": int(now),
+            "exp": int(now + SESSION_TTL),
+        }
+        return jose_jwt.encode(claims, SESSION_SECRET, algorithm="HS256")
+    token = make_token()
+    db.add(models.Session(token=token, user_id=user.id, created_at=now))
+    return token
+
+
+def _signed_token_claims(token: str) -> Optional[dict]:
+    """Verify a signed token's signature and expiry; None if it is invalid."""
+    if not SESSION_SECRET:
+        return None
+    try:
+        return jose_jwt.decode(token, SESSION_SECRET, algorithms=["HS256"])
+    except JWTError:
+        return None
+
+
+def revoke_token(db: Session, token: str) -> None:
+    """Log a token out: delete its session row, or revoke it if it is signed."""
+    if "." not in token:
+        db.query(models.Session).filter(models.Session.token == token).delete()
+        db.commit()
+        invalidate_session(token)
+        return
+    claims = _signed_token_claims(token)
+    if not claims:
+        return
+    jti, exp = claims["jti"], float(claims["exp"])
+    if not db.query(models.RevokedToken).filter(models.RevokedToken.jti == jti).first():
+        db.add(models.RevokedToken(jti=jti, expires_at=exp))
+        db.commit()
+    _revoked_jtis[jti] = exp
+    event_bus.publish(events.SESSION_INVALIDATED, {"jti": jti, "expiresAt": exp})
+
+
+def load_revoked_tokens() -> None:
+    """Fill the in-memory revocation set from unexpired revoked_tokens rows."""
+    db = SessionLocal()
+    try:
+        rows = db.query(models.RevokedToken).filter(models.RevokedToken.expires_at > time.time()).all()
+        _revoked_jtis.update({r.jti: r.expires_at for r in rows})
+    finally:
+        db.close()
+
+
+def user_for_token(db: Session, token: str) -> Optional[dict]:
+    """Resolve a session token to the user dict, or None if it is unknown.
+
+    Signed tokens (the ones with dots) are verified in memory. Either kind
+    is then served from the session cache when possible; a miss costs one
+    query. Opaque tokens older than SESSION_TTL are rejected.
+    """
+    claims = None
+    if "." in token:
+        claims = _signed_token_claims(token)
+        if not claims or claims["jti"] in _revoked_jtis:
+            return None
+
+    key = token_hash(token)
+    cached = session_cache.get(key)
+    if cached is not None:
+        return cached
+    if claims:
+        user = db.query(models.User).filter(models.User.id == claims["sub"]).first()
+    else:
+        user = (
+            db.query(models.User)
+            .join(models.Session, models.Session.user_id == models.User.id)
+            .filter(
+                models.Session.token == token,
+                or_(models.Session.created_at == None, models.Session.created_at > time.time() - SESSION_TTL),
+            )
+            .first()
+        )
+    if not user:
+        return None
+    result = user_to_dict(user)
+    session_cache.put(key, result)
+    return result
+
+
+def _bearer_token(authorization: Optional[str]) -> str:
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
-    token = authorization.split(" ", 1)[1]
-    session = db.query(models.Session).filter(models.Session.token == token).first()
-    if not session:
+    return authorization.split(" ", 1)[1]
+
+
+def get_current_user(authorization: str = Header(None), db: Session = Depends(get_db)) -> dict:
+    user = user_for_token(db, _bearer_token(authorization))
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid or expired session token")
-    user = db.query(models.User).filter(models.User.id == session.user_id).first()
+    return user
+
+
+async def get_current_user_async(authorization: str = Header(None), db: AsyncSession = Depends(get_async_db)) -> dict:
+    """`get_current_user` for `async def` endpoints; shares the request's AsyncSession."""
+    user = await db.run_sync(user_for_token, _bearer_token(authorization))
     if not user:
         raise HTTPException(status_code=401, detail="Invalid or expired session token")
-    return user_to_dict(user)
+    return user
+
+
+async def get_stream_user(authorization: str = Header(None), token: Optional[str] = Query(None)) -> dict:
+    """Auth for long-lived streams: also accepts `?token=`, since EventSource cannot
+    set headers, and uses its own short session so the stream does not pin a
+    pooled connection."""
+    if token:
+        authorization = f"Bearer {token}"
+    async with AsyncSessionLocal() as db:
+        return await get_current_user_async(authorization, db)
 
 
 # ── Lifespan (create tables + seed) ─────────────────────────────────────────
 
+# Unique keys that ON CONFLICT clauses rely on, for tables that predate them:
+# (table, columns, migration that drops duplicates). The index takes the name
+# Postgres gives the matching UNIQUE constraint, so an existing one is kept.
+REQUIRED_UNIQUE_KEYS = [
+    ("instance_participants", ("instance_id", "user_id"), "neon_migration_participant_unique.sql"),
+    ("lobby_participants", ("instance_id", "user_id"), "neon_migration_participant_unique.sql"),
+    ("connections", ("user_id", "connected_user_id"), "neon_migration_connection_unique.sql"),
+]
+
+
+def _ensure_unique_keys(conn) -> None:
+    """Create the REQUIRED_UNIQUE_KEYS indexes if missing. Refuses to start
+    when duplicate rows prevent it, since every insert would then fail.
+    Runs inside `_migrate_schema`'s locked transaction, so workers booting
+    together cannot collide on creating the same index."""
+    from sqlalchemy.exc import IntegrityError
+
+    for table, columns, migration in REQUIRED_UNIQUE_KEYS:
+        name = f"{table}_{'_'.join(columns)}_key"
+        try:
+            conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+        except IntegrityError as exc:
+            raise RuntimeError(
+                f"{table} has duplicate ({', '.join(columns)}) rows; run backend/{migration} first"
+            ) from exc
+
+
+def _create_missing_indexes(conn) -> None:
+    """Create indexes declared on the models that predate their tables.
+
+    Only on tables up to STARTUP_INDEX_MAX_BYTES: building an index blocks
+    writes to its table, so bigger ones are left to the CREATE INDEX
+    CONCURRENTLY in the neon_migration_*.sql files, with a warning.
+    """
+    inspector = sa_inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        missing = [ix for ix in table.indexes if ix.name not in existing]
+        if not missing:
+            continue
+        size = conn.scalar(text("SELECT pg_relation_size(to_regclass(:table))"), {"table": table.name})
+        for index in missing:
+            if size > STARTUP_INDEX_MAX_BYTES:
+                logger.warning(
+                    "Index %s on %s is missing; build it with its backend/neon_migration_*.sql", index.name, table.name
+                )
+            else:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def _migrate_schema() -> None:
+    """Bring tables created by older versions up to date.
+
+    Every worker runs this at startup, so it runs in one transaction holding
+    the STARTUP_DDL_LOCK advisory lock: workers take turns, and all but the
+    first find nothing left to do.
+    """
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": STARTUP_DDL_LOCK})
+        Base.metadata.create_all(conn)
+        inspector = sa_inspect(conn)
+
+        # Add friends column to users table if it doesn't exist
+        user_columns = [c["name"] for c in inspector.get_columns("users")]
+        if "friends" not in user_columns:
+            conn.execute(text("ALTER TABLE users ADD COLUMN friends JSON DEFAULT '[]'"))
+
+        # quest_instances.start_time was an ISO string; make it a real timestamp.
+        # Strings Postgres cannot parse (even well-shaped ones like 2026-13-45) become NULL.
+        start_col = next(c for c in inspector.get_columns("quest_instances") if c["name"] == "start_time")
+        if not isinstance(start_col["type"], DateTime):
+            conn.execute(text(
+                "CREATE FUNCTION pg_temp.try_timestamp(value TEXT) RETURNS TIMESTAMP LANGUAGE plpgsql AS $$ "
+                "BEGIN RETURN value::timestamp; EXCEPTION WHEN others THEN RETURN NULL; END $$"
+            ))
+            conn.execute(text(
+                "ALTER TABLE quest_instances ALTER COLUMN start_time TYPE TIMESTAMP "
+                "USING pg_temp.try_timestamp(start_time)"
+            ))
+
+        _create_missing_indexes(conn)
+        _ensure_unique_keys(conn)
+
+
 def _seed_data() -> None:
-    Base.metadata.create_all(engine)
+    _migrate_schema()
     db = Session(bind=engine)
     try:
-        # Migrate: add friends column to users table if it doesn't exist
-        from sqlalchemy import inspect as sa_inspect, text
-        inspector = sa_inspect(engine)
-        user_columns = [c["name"] for c in inspector.get_columns("users")]
-        if "friends" not in user_columns:
-            with engine.begin() as conn:
-                conn.execute(text("ALTER TABLE users ADD COLUMN friends JSON DEFAULT '[]'"))
 
         # Seed hubs if empty
         if db.query(models.Hub).count() == 0:
@@ -690,10 +1235,165 @@ def _seed_data() -> None:
         db.close()
 
 
+# ── Background Tasks ─────────────────────────────────────────────────────────
+
+def sweep_expired_instances() -> int:
+    """Deactivate expired and no-show quest instances in one bulk UPDATE.
+
+    Returns the number of instances deactivated.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(models.QuestInstance)
+            .where(
+                models.QuestInstance.is_active == True,
+                _expired_instance_clause(time.time(), datetime.now()),
+            )
+            .values(is_active=False)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount
+    finally:
+        db.close()
+
+
+async def _run_expiry_sweeper() -> None:
+    while True:
+        try:
+            await asyncio.to_thread(sweep_expired_instances)
+        except Exception:
+            logger.exception("Quest expiry sweep failed")
+        await asyncio.sleep(EXPIRY_SWEEP_INTERVAL)
+
+
+def purge_expired_sessions() -> int:
+    """Delete session rows and revocations whose tokens can no longer be used.
+
+    Returns the number of session rows deleted.
+    """
+    now = time.time()
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            delete(models.Session).where(models.Session.created_at < now - SESSION_TTL)
+        )
+        db.execute(delete(models.RevokedToken).where(models.RevokedToken.expires_at < now))
+        db.commit()
+    finally:
+        db.close()
+    for jti, exp in list(_revoked_jtis.items()):
+        if exp < now:
+            _revoked_jtis.pop(jti, None)
+    return result.rowcount
+
+
+async def _run_session_purge() -> None:
+    while True:
+        try:
+            await asyncio.to_thread(purge_expired_sessions)
+        except Exception:
+            logger.exception("Session purge failed")
+        await asyncio.sleep(SESSION_PURGE_INTERVAL)
+
+
+def load_presence() -> None:
+    """Seed the presence store from last_active values flushed before a restart."""
+    db = SessionLocal()
+    try:
+        rows = db.query(models.HubMember.hub_id, models.HubMember.user_id, models.HubMember.last_active).filter(
+            models.HubMember.last_active >= time.time() - ONLINE_TIMEOUT
+        ).all()
+    finally:
+        db.close()
+    presence_store.merge(rows, ONLINE_TIMEOUT)
+
+
+def flush_presence() -> int:
+    """Write the heartbeats received since the last flush to hub_members.last_active
+    in one UPDATE, and share them with the other workers.
+
+    Returns the number of heartbeats flushed.
+    """
+    entries = presence_store.drain_dirty()
+    presence_store.prune(time.time(), ONLINE_TIMEOUT)
+    if not entries:
+        return 0
+    for i in range(0, len(entries), PRESENCE_SYNC_CHUNK):
+        event_bus.publish(events.HUB_PRESENCE_SYNC, {"entries": entries[i:i + PRESENCE_SYNC_CHUNK]})
+    beats = values(
+        column("hub_id", String), column("user_id", String), column("last_active", Float), name="beats"
+    ).data(entries)
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(models.HubMember)
+            .where(models.HubMember.hub_id == beats.c.hub_id, models.HubMember.user_id == beats.c.user_id)
+            .values(last_active=beats.c.last_active)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    finally:
+        db.close()
+    return len(entries)
+
+
+async def _run_presence_flush() -> None:
+    while True:
+        await asyncio.sleep(PRESENCE_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(flush_presence)
+        except Exception:
+            logger.exception("Presence flush failed")
+
+
+async def _run_presence_sync() -> None:
+    """Merge heartbeats flushed by any worker into this worker's presence store."""
+    with event_bus.subscribe(events.HUB_PRESENCE_SYNC) as sub:
+        async for event in sub:
+            presence_store.merge((tuple(entry) for entry in event.payload["entries"]), ONLINE_TIMEOUT)
+
+
+async def _run_thumbnail_backfill() -> None:
+    try:
+        await asyncio.to_thread(backfill_thumbnails)
+    except Exception:
+        logger.exception("Thumbnail backfill failed")
+
+
 @asynccontextmanager
 async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    global _thumbnail_pool
     _seed_data()
-    yield
+    load_revoked_tokens()
+    load_presence()
+    await event_bus.start()
+    _thumbnail_pool = ProcessPoolExecutor(THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    tasks = [
+        asyncio.create_task(_run_expiry_sweeper()),
+        asyncio.create_task(lobby_channel.run()),
+        asyncio.create_task(_run_session_invalidation()),
+        asyncio.create_task(_run_session_purge()),
+        asyncio.create_task(_run_presence_flush()),
+        asyncio.create_task(_run_presence_sync()),
+        asyncio.create_task(hub_directory.run()),
+        asyncio.create_task(_run_drive_uploads()),
+        asyncio.create_task(_run_thumbnail_backfill()),
+    ]
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        try:
+            await asyncio.to_thread(flush_presence)
+        except Exception:
+            logger.exception("Final presence flush failed")
+        pool, _thumbnail_pool = _thumbnail_pool, None
+        await asyncio.to_thread(pool.shutdown, cancel_futures=True)
+        await event_bus.stop()
+        await async_engine.dispose()
 
 
 # ── App ──────────────────────────────────────────────────────────────────────
@@ -929,7 +1629,7 @@ class ChatMessageSchema(BaseModel):
     timestamp: float
 
 class SendMessageRequest(BaseModel):
-    content: str
+    content: str = Field(max_length=1000)  # keeps chat.message events under the NOTIFY size cap
 
 class SafetyReport(BaseModel):
     reporterId: str = ""
@@ -1026,12 +1726,19 @@ def cleanup_all_participants(db: Session = Depends(get_db)):
     }
 
 
+@app.get("/api/admin/pool-metrics", tags=["Utility"])
+def pool_metrics():
+    """Connection pool occupancy and checkout wait times, for sizing DB_POOL_SIZE."""
+    return {
+        "sync": pool_status(engine.pool),
+        "async": pool_status(async_engine.sync_engine.pool),
+    }
+
+
 # ── Auth ─────────────────────────────────────────────────────────────────────
 
 @app.post("/api/auth/google", response_model=AuthResponse, tags=["Auth"])
 async def auth_google(body: GoogleAuthRequest, db: Session = Depends(get_db)):
-    from jose import jwt as jose_jwt
-
     refresh_token = None
 
     if body.code:
@@ -1082,11 +1789,12 @@ async def auth_google(body: GoogleAuthRequest, db: Session = Depends(get_db)):
             google_refresh_token=refresh_token,
         ))
     db.commit()
+    if existing:
+        invalidate_user_sessions(user_id)
     ensure_user_stores(db, user_id)
 
     user_obj = db.query(models.User).filter(models.User.id == user_id).first()
-    token = make_token()
-    db.add(models.Session(token=token, user_id=user_id, created_at=time.time()))
+    token = issue_session_token(db, user_obj)
     db.commit()
     return {"user": user_to_dict(user_obj), "token": token}
 
@@ -1107,8 +1815,7 @@ def auth_demo(body: DemoAuthRequest = None, db: Session = Depends(get_db)):
     db.commit()
     ensure_user_stores(db, user_id)
 
-    token = make_token()
-    db.add(models.Session(token=token, user_id=user_id, created_at=time.time()))
+    token = issue_session_token(db, user)
     db.commit()
     return {"user": user_to_dict(user), "token": token}
 
@@ -1116,48 +1823,183 @@ def auth_demo(body: DemoAuthRequest = None, db: Session = Depends(get_db)):
 @app.post("/api/auth/logout", tags=["Auth"])
 def auth_logout(user: dict = Depends(get_current_user), authorization: str = Header(None), db: Session = Depends(get_db)):
     token = authorization.split(" ", 1)[1]
-    session = db.query(models.Session).filter(models.Session.token == token).first()
-    if session:
-        db.delete(session)
-        db.commit()
+    revoke_token(db, token)
     return {"ok": True}
 
 
 # ── Hubs ─────────────────────────────────────────────────────────────────────
 
+class HubDirectory:
+    """Every hub as `hub_to_dict` output with its member count, loaded in one
+    grouped query and cached.
+
+    Also caches which hub each user is a member of, for heartbeats.
+
+    Joining a hub publishes `hub.presence` with status "joined"; `run` marks
+    the directory stale and records the membership on those events, so
+    every worker sees the change. `ttl` is a backstop for changes made
+    outside the API.
+
+    Nearest-hub lookups use a KD-tree rebuilt with each load, or, with
+    HUB_SPATIAL_INDEX=earthdistance and the extension installed, a GiST
+    nearest-neighbour query in Postgres.
+    """
+
+    def __init__(self, ttl: float, spatial_index: str = "memory") -> None:
+        self.ttl = ttl
+        self.spatial_index = spatial_index
+        self._hubs: list[dict] = []
+        self._by_id: dict[str, dict] = {}
+        self._geo_index = GeoIndex([])
+        self._use_earthdistance: Optional[bool] = None
+        # user_id -> (expires_at, hub_id or None)
+        self._member_hubs: dict[str, tuple[float, Optional[str]]] = {}
+        self._loaded_at = float("-inf")
+        self._invalidated_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _stale(self) -> bool:
+        now = time.monotonic()
+        return self._loaded_at < self._invalidated_at or now - self._loaded_at > self.ttl
+
+    def invalidate(self) -> None:
+        self._invalidated_at = time.monotonic()
+
+    async def hubs(self, db: AsyncSession) -> list[dict]:
+        if self._stale():
+            async with self._lock:
+                if self._stale():
+                    await self._load(db)
+        return self._hubs
+
+    async def get(self, db: AsyncSession, hub_id: str) -> Optional[dict]:
+        await self.hubs(db)
+        return self._by_id.get(hub_id)
+
+    async def member_hub(self, db: AsyncSession, user_id: str) -> Optional[str]:
+        """The hub a user has joined, or None. Users belong to one hub at a time."""
+        now = time.monotonic()
+        cached = self._member_hubs.get(user_id)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        hub_id = await db.scalar(select(models.HubMember.hub_id).where(models.HubMember.user_id == user_id).limit(1))
+        self.set_member_hub(user_id, hub_id)
+        return hub_id
+
+    def set_member_hub(self, user_id: str, hub_id: Optional[str]) -> None:
+        self._member_hubs[user_id] = (time.monotonic() + self.ttl, hub_id)
+
+    async def _load(self, db: AsyncSession) -> None:
+        started = time.monotonic()
+        self._member_hubs = {uid: entry for uid, entry in self._member_hubs.items() if entry[0] > started}
+        rows = (await db.execute(
+            select(models.Hub, func.count(models.HubMember.id))
+            .outerjoin(models.HubMember, models.HubMember.hub_id == models.Hub.id)
+            .group_by(models.Hub.id)
+            .order_by(models.Hub.id)
+        )).all()
+        self._hubs = [hub_to_dict(h, active_users=count) for h, count in rows]
+        self._by_id = {h["id"]: h for h in self._hubs}
+        self._geo_index = GeoIndex([(h.id, h.lat, h.lng) for h, _ in rows])
+        if self._use_earthdistance is None:
+            self._use_earthdistance = await self._earthdistance_available(db)
+        self._loaded_at = started
+
+    async def _earthdistance_available(self, db: AsyncSession) -> bool:
+        if self.spatial_index != "earthdistance":
+            return False
+        installed = db.bind.dialect.name == "postgresql" and await db.scalar(
+            text("SELECT count(*) FROM pg_extension WHERE extname = 'earthdistance'")
+        )
+        if not installed:
+            logger.warning("HUB_SPATIAL_INDEX=earthdistance but the extension is not installed; using the in-memory index")
+        return bool(installed)
+
+    async def _nearest_ids_in_db(
+        self, db: AsyncSession, lat: float, lng: float, limit: Optional[int], radius_km: Optional[float]
+    ) -> list[str]:
+        # `<->` on cubes is answered by the GiST index on ll_to_earth(lat, lng);
+        # earth_box is its bounding-box prefilter for the radius
+        sql = "SELECT id FROM hubs"
+        params: dict = {"lat": lat, "lng": lng}
+        if radius_km is not None:
+            sql += " WHERE earth_box(ll_to_earth(:lat, :lng), :radius_m) @> ll_to_earth(lat, lng)"
+            params["radius_m"] = radius_km * 1000
+        sql += " ORDER BY ll_to_earth(lat, lng) <-> ll_to_earth(:lat, :lng)"
+        if limit is not None:
+            sql += " LIMIT :limit"
+            params["limit"] = limit
+        return list((await db.scalars(text(sql), params)).all())
+
+    async def nearest(
+        self, db: AsyncSession, lat: float, lng: float, limit: Optional[int] = None, radius_km: Optional[float] = None
+    ) -> list[dict]:
+        """Hubs closest to (lat, lng) first, each with its `distance` in km."""
+        await self.hubs(db)
+        if self._use_earthdistance:
+            hub_ids = await self._nearest_ids_in_db(db, lat, lng, limit, radius_km)
+        else:
+            hub_ids = [hub_id for hub_id, _ in self._geo_index.nearest(lat, lng, limit, radius_km)]
+        result = []
+        for hub_id in hub_ids:
+            h = self._by_id.get(hub_id)
+            if not h:
+                continue
+            distance = haversine(lat, lng, h["coordinates"]["lat"], h["coordinates"]["lng"])
+            # earth_box is a cube around the circle and Postgres's earth is slightly larger
+            if radius_km is not None and distance > radius_km:
+                continue
+            result.append({**h, "distance": round(distance, 2)})
+        return result
+
+    async def run(self) -> None:
+        with event_bus.subscribe(events.HUB_PRESENCE) as sub:
+            async for event in sub:
+                if event.payload.get("status") == "joined":
+                    self.invalidate()
+                    self.set_member_hub(event.payload["userId"], event.payload["hubId"])
+
+
+hub_directory = HubDirectory(HUB_DIRECTORY_TTL, HUB_SPATIAL_INDEX)
+
+
 @app.get("/api/hubs", tags=["Hubs"])
-def list_hubs(lat: Optional[float] = Query(None), lng: Optional[float] = Query(None), db: Session = Depends(get_db)):
-    all_hubs = db.query(models.Hub).all()
-    result = []
-    for h in all_hubs:
-        active_count = db.query(models.HubMember).filter(models.HubMember.hub_id == h.id).count()
-        distance = 0.0
-        if lat is not None and lng is not None:
-            distance = round(haversine(lat, lng, h.lat, h.lng), 2)
-        result.append(hub_to_dict(h, active_users=active_count, distance=distance))
-    if lat is not None and lng is not None:
-        result.sort(key=lambda x: x["distance"])
-    return result
+async def list_hubs(
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: Optional[float] = Query(None, gt=0, description="Only hubs within this distance of lat/lng"),
+    limit: Optional[int] = Query(None, ge=1, description="At most this many hubs"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """All hubs, or with `lat`/`lng` the nearest ones first with their distance."""
+    if lat is None or lng is None:
+        if radius_km is not None:
+            raise HTTPException(status_code=400, detail="radius_km requires lat and lng")
+        hubs = await hub_directory.hubs(db)
+        return hubs[:limit] if limit else hubs
+    return await hub_directory.nearest(db, lat, lng, limit=limit, radius_km=radius_km)
 
 
 @app.get("/api/hubs/{hub_id}", tags=["Hubs"])
-def get_hub(hub_id: str, db: Session = Depends(get_db)):
-    h = db.query(models.Hub).filter(models.Hub.id == hub_id).first()
-    if not h:
+async def get_hub(hub_id: str, db: AsyncSession = Depends(get_async_db)):
+    hub = await hub_directory.get(db, hub_id)
+    if not hub:
         raise HTTPException(status_code=404, detail="Hub not found")
-    active_count = db.query(models.HubMember).filter(models.HubMember.hub_id == hub_id).count()
-    return hub_to_dict(h, active_users=active_count)
+    return hub
 
 
 @app.post("/api/hubs/{hub_id}/join", tags=["Hubs"])
-def join_hub(hub_id: str, user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    h = db.query(models.Hub).filter(models.Hub.id == hub_id).first()
-    if not h:
+async def join_hub(hub_id: str, user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    if not await hub_directory.get(db, hub_id):
         raise HTTPException(status_code=404, detail="Hub not found")
     # Remove from all other hubs
-    db.query(models.HubMember).filter(models.HubMember.user_id == user["id"]).delete()
+    await db.execute(delete(models.HubMember).where(models.HubMember.user_id == user["id"]))
     db.add(models.HubMember(hub_id=hub_id, user_id=user["id"]))
-    db.commit()
+    await db.commit()
+    presence_store.leave(user["id"], keep_hub_id=hub_id)
+    hub_directory.invalidate()
+    hub_directory.set_member_hub(user["id"], hub_id)
+    event_bus.publish(events.HUB_PRESENCE, {"hubId": hub_id, "userId": user["id"], "status": "joined"})
     return {"ok": True, "hubId": hub_id}
 
 
@@ -1165,63 +2007,109 @@ ONLINE_TIMEOUT = 30  # seconds — users inactive longer than this are considere
 
 
 @app.post("/api/hubs/{hub_id}/heartbeat", tags=["Hubs"])
-def hub_heartbeat(hub_id: str, user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    """Update the user's last_active timestamp to mark them as online."""
-    mem = db.query(models.HubMember).filter(
-        models.HubMember.hub_id == hub_id,
-        models.HubMember.user_id == user["id"],
-    ).first()
-    if mem:
-        mem.last_active = time.time()
-        db.commit()
+async def hub_heartbeat(hub_id: str, user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    """Mark a member of the hub as online; heartbeats from non-members are ignored.
+
+    The hub and the membership come from `hub_directory`'s caches, and only
+    the in-memory presence store is written; last_active is flushed to the
+    DB in batches every PRESENCE_FLUSH_INTERVAL."""
+    if not await hub_directory.get(db, hub_id):
+        raise HTTPException(status_code=404, detail="Hub not found")
+    if await hub_directory.member_hub(db, user["id"]) != hub_id:
+        return {"ok": True}
+    if presence_store.heartbeat(hub_id, user["id"], time.time(), ONLINE_TIMEOUT):
+        event_bus.publish(events.HUB_PRESENCE, {"hubId": hub_id, "userId": user["id"], "status": "online"})
     return {"ok": True}
 
 
-@app.get("/api/hubs/{hub_id}/users", tags=["Hubs"])
-def hub_online_users(hub_id: str, db: Session = Depends(get_db)):
-    h = db.query(models.Hub).filter(models.Hub.id == hub_id).first()
-    if not h:
-        raise HTTPException(status_code=404, detail="Hub not found")
-    cutoff = time.time() - ONLINE_TIMEOUT
-    members = db.query(models.HubMember).filter(
-        models.HubMember.hub_id == hub_id,
-        models.HubMember.last_active != None,
-        models.HubMember.last_active >= cutoff,
-    ).all()
-    result = []
-    for mem in members:
-        u = db.query(models.User).filter(models.User.id == mem.user_id).first()
-        m = db.query(models.Monster).filter(models.Monster.user_id == mem.user_id).first()
-        result.append({
-            "id": mem.user_id,
-            "name": u.name if u else "Unknown",
+def avatar_position(user_id: str) -> dict:
+    """Where a user's monster stands in the hub: pseudo-random but stable across
+    workers and restarts, unlike the per-process salted hash()."""
+    digest = hashlib.blake2b(user_id.encode(), digest_size=4).digest()
+    return {
+        "x": int.from_bytes(digest[:2], "big") % 100,
+        "y": int.from_bytes(digest[2:], "big") % 100,
+    }
+
+
+async def load_online_users(db: AsyncSession, hub_id: str, user_ids: list[str]) -> list[dict]:
+    """Names and monsters of hub members, in `user_ids` order, in one joined query."""
+    if not user_ids:
+        return []
+    rows = (await db.execute(
+        select(
+            models.User.id,
+            models.User.name,
+            models.Monster.evolution,
+            models.Monster.level,
+            models.Monster.selected_monster,
+            models.Monster.monster_image_url,
+        )
+        .join(models.HubMember, and_(models.HubMember.user_id == models.User.id, models.HubMember.hub_id == hub_id))
+        .outerjoin(models.Monster, models.Monster.user_id == models.User.id)
+        .where(models.User.id.in_(user_ids))
+    )).all()
+    by_id = {}
+    for r in rows:
+        by_id[r.id] = {
+            "id": r.id,
+            "name": r.name,
             "monster": {
-                "evolution": m.evolution if m else "baby",
-                "level": m.level if m else 1,
-                "monsterType": m.selected_monster if m else 1,
-                "monsterImageUrl": m.monster_image_url if m else None,
-                "position": {
-                    "x": hash(mem.user_id) % 100,
-                    "y": hash(mem.user_id + "y") % 100,
-                },
+                "evolution": r.evolution or "baby",
+                "level": r.level or 1,
+                "monsterType": r.selected_monster or 1,
+                "monsterImageUrl": r.monster_image_url,
+                "position": avatar_position(r.id),
             },
-        })
-    return result
+        }
+    return [by_id[uid] for uid in user_ids if uid in by_id]
+
+
+@app.get("/api/hubs/{hub_id}/users", tags=["Hubs"])
+async def hub_online_users(
+    hub_id: str,
+    since: Optional[float] = Query(None, description="serverTime of the previous response; returns only changes"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Users online in a hub.
+
+    Without `since`, the full list. With `since`, only what changed after it:
+    `online` (users who came online), `offline` (ids of users who left) and
+    the `serverTime` to pass next time. `reset` means `since` was too old to
+    diff against, and `online` is the full list.
+    """
+    if not await hub_directory.get(db, hub_id):
+        raise HTTPException(status_code=404, detail="Hub not found")
+    now = time.time()
+    if since is None:
+        return await load_online_users(db, hub_id, list(presence_store.online(hub_id, now - ONLINE_TIMEOUT)))
+
+    changes = presence_store.changes(hub_id, since, now, ONLINE_TIMEOUT)
+    if changes is None:
+        online = await load_online_users(db, hub_id, list(presence_store.online(hub_id, now - ONLINE_TIMEOUT)))
+        return {"online": online, "offline": [], "reset": True, "serverTime": now}
+    came_online, went_offline = changes
+    return {
+        "online": await load_online_users(db, hub_id, came_online),
+        "offline": went_offline,
+        "reset": False,
+        "serverTime": now,
+    }
 
 
 # ── Quests ───────────────────────────────────────────────────────────────────
 
 @app.get("/api/quests/templates", tags=["Quests"])
-def list_quest_templates(db: Session = Depends(get_db)):
-    templates = db.query(models.QuestTemplate).all()
+async def list_quest_templates(db: AsyncSession = Depends(get_async_db)):
+    templates = (await db.scalars(select(models.QuestTemplate))).all()
     return [template_to_dict(t) for t in templates]
 
 
 @app.post("/api/quests/templates", tags=["Quests"])
-def create_quest_template(body: CreateTemplateRequest, db: Session = Depends(get_db)):
+async def create_quest_template(body: CreateTemplateRequest, db: AsyncSession = Depends(get_async_db)):
     """Create a new quest template."""
     # Check if template with this ID already exists
-    existing = db.query(models.QuestTemplate).filter(models.QuestTemplate.id == body.id).first()
+    existing = await db.get(models.QuestTemplate, body.id)
     if existing:
         raise HTTPException(status_code=400, detail="Template with this ID already exists")
     
@@ -1248,59 +2136,21 @@ def create_quest_template(body: CreateTemplateRequest, db: Session = Depends(get
         tags=body.tags,
     )
     db.add(template)
-    db.commit()
-    db.refresh(template)
+    await db.commit()
     
     return template_to_dict(template)
 
 
 @app.get("/api/quests/instances", tags=["Quests"])
-def list_quest_instances(hub_id: Optional[str] = Query(None), db: Session = Depends(get_db)):
-    q = db.query(models.QuestInstance).filter(models.QuestInstance.is_active == True)
-    if hub_id:
-        q = q.filter(models.QuestInstance.hub_id == hub_id)
-    instances = q.all()
-    now = time.time()
-    result = []
-    for inst in instances:
-        # Auto-expire quests past their deadline
-        if inst.deadline and now > inst.deadline:
-            inst.is_active = False
-            continue
-
-        # Auto-delete quests past start_time with no participants
-        if inst.start_time and inst.current_participants == 0:
-            try:
-                from datetime import datetime
-                start_dt = datetime.fromisoformat(inst.start_time)
-                if datetime.now() > start_dt:
-                    inst.is_active = False
-                    continue
-            except:
-                pass  # Invalid date format, skip auto-deletion
-
-        tpl = db.query(models.QuestTemplate).filter(models.QuestTemplate.id == inst.template_id).first()
-        if not tpl:
-            continue
-        pids = [p.user_id for p in db.query(models.InstanceParticipant).filter(
-            models.InstanceParticipant.instance_id == inst.instance_id).all()]
-
-        # Get creator name
-        creator_name = None
-        if inst.creator_user_id:
-            creator = db.query(models.User).filter(models.User.id == inst.creator_user_id).first()
-            if creator:
-                creator_name = creator.name
-
-        result.append(instance_to_dict(inst, tpl, pids, creator_name))
-    db.commit()  # Persist any deadline-based deactivations
-    return result
+async def list_quest_instances(hub_id: Optional[str] = Query(None), db: AsyncSession = Depends(get_async_db)):
+    # Expired quests are deactivated by the background sweeper, not here
+    return await db.run_sync(lambda s: load_instance_dicts(s, live_instances_query(s, hub_id).all()))
 
 
 @app.post("/api/quests/instances", tags=["Quests"])
-def create_quest_instance(body: CreateInstanceRequest, user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def create_quest_instance(body: CreateInstanceRequest, user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
     # Check user monster for level and coins
-    m = db.query(models.Monster).filter(models.Monster.user_id == user["id"]).first()
+    m = await db.scalar(select(models.Monster).where(models.Monster.user_id == user["id"]))
     if not m:
         raise HTTPException(status_code=404, detail="Monster not found")
 
@@ -1315,10 +2165,10 @@ def create_quest_instance(body: CreateInstanceRequest, user: dict = Depends(get_
     # Deduct 100 coins
     m.coins = m.coins - 100
 
-    tpl = db.query(models.QuestTemplate).filter(models.QuestTemplate.id == body.templateId).first()
+    tpl = await db.get(models.QuestTemplate, body.templateId)
     if not tpl:
         raise HTTPException(status_code=404, detail="Template not found")
-    hub = db.query(models.Hub).filter(models.Hub.id == body.hubId).first()
+    hub = await db.get(models.Hub, body.hubId)
     if not hub:
         raise HTTPException(status_code=404, detail="Hub not found")
 
@@ -1331,25 +2181,25 @@ def create_quest_instance(body: CreateInstanceRequest, user: dict = Depends(get_
         creator_user_id=user["id"],
         current_participants=1,
         is_active=True,
-        start_time=body.startTime,
+        start_time=parse_start_time(body.startTime),
         location=body.location or hub.location,
         deadline=deadline,
     )
     db.add(inst)
-    db.flush()  # Flush parent row before inserting FK-dependent children
+    await db.flush()  # Flush parent row before inserting FK-dependent children
     db.add(models.InstanceParticipant(instance_id=inst_id, user_id=user["id"]))
     # Auto-create lobby entry (host)
     db.add(models.LobbyParticipant(instance_id=inst_id, user_id=user["id"], is_ready=False, is_host=True))
-    db.commit()
+    await db.commit()
 
     pids = [user["id"]]
     return instance_to_dict(inst, tpl, pids, user["name"])
 
 
 @app.delete("/api/quests/instances/{instance_id}", tags=["Quests"])
-def delete_quest_instance(instance_id: str, user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def delete_quest_instance(instance_id: str, user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
     """Delete a quest instance. Only the creator can delete it."""
-    inst = db.query(models.QuestInstance).filter(models.QuestInstance.instance_id == instance_id).first()
+    inst = await db.get(models.QuestInstance, instance_id)
     if not inst:
         raise HTTPException(status_code=404, detail="Quest not found")
 
@@ -1358,56 +2208,82 @@ def delete_quest_instance(instance_id: str, user: dict = Depends(get_current_use
         raise HTTPException(status_code=403, detail="Only the quest creator can delete this quest")
 
     # Delete related records
-    db.query(models.InstanceParticipant).filter(models.InstanceParticipant.instance_id == instance_id).delete()
-    db.query(models.LobbyParticipant).filter(models.LobbyParticipant.instance_id == instance_id).delete()
-    db.delete(inst)
-    db.commit()
+    await db.execute(delete(models.InstanceParticipant).where(models.InstanceParticipant.instance_id == instance_id))
+    await db.execute(delete(models.LobbyParticipant).where(models.LobbyParticipant.instance_id == instance_id))
+    await db.delete(inst)
+    await db.commit()
 
     return {"ok": True, "message": "Quest deleted successfully"}
 
 
+async def take_quest_slot(db: AsyncSession, instance_id: str, user_id: str) -> Optional[int]:
+    """Add a user to a quest instance and count them, in the caller's transaction.
+
+    Returns the new participant count, or None if the user had already
+    joined. The capacity check and the increment are one conditional
+    UPDATE, so concurrent joins cannot overfill a quest; a full quest rolls
+    the participant row back and raises 400.
+    """
+    added = await db.scalar(
+        pg_insert(models.InstanceParticipant)
+        .values(instance_id=instance_id, user_id=user_id)
+        .on_conflict_do_nothing(index_elements=["instance_id", "user_id"])
+        .returning(models.InstanceParticipant.id)
+    )
+    if added is None:
+        return None
+    capacity = select(models.QuestTemplate.max_participants).where(
+        models.QuestTemplate.id == models.QuestInstance.template_id
+    ).scalar_subquery()
+    count = await db.scalar(
+        update(models.QuestInstance)
+        .where(
+            models.QuestInstance.instance_id == instance_id,
+            models.QuestInstance.current_participants < capacity,
+        )
+        .values(current_participants=models.QuestInstance.current_participants + 1)
+        .returning(models.QuestInstance.current_participants)
+        .execution_options(synchronize_session=False)
+    )
+    if count is None:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Quest is full")
+    return count
+
+
+async def add_to_lobby(db: AsyncSession, instance_id: str, user_id: str) -> None:
+    await db.execute(
+        pg_insert(models.LobbyParticipant)
+        .values(instance_id=instance_id, user_id=user_id, is_ready=False, is_host=False)
+        .on_conflict_do_nothing(index_elements=["instance_id", "user_id"])
+    )
+
+
 @app.post("/api/quests/instances/{instance_id}/join", tags=["Quests"])
-def join_quest_instance(instance_id: str, user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    inst = db.query(models.QuestInstance).filter(models.QuestInstance.instance_id == instance_id).first()
+async def join_quest_instance(instance_id: str, user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    inst = await db.get(models.QuestInstance, instance_id)
     if not inst:
         raise HTTPException(status_code=404, detail="Instance not found")
     if not inst.is_active:
         raise HTTPException(status_code=400, detail="Quest is no longer active")
     if inst.deadline and time.time() > inst.deadline:
         inst.is_active = False
-        db.commit()
+        await db.commit()
         raise HTTPException(status_code=400, detail="Quest has expired")
 
-    tpl = db.query(models.QuestTemplate).filter(models.QuestTemplate.id == inst.template_id).first()
-    pids = [p.user_id for p in db.query(models.InstanceParticipant).filter(
-        models.InstanceParticipant.instance_id == instance_id).all()]
-
-    # Get creator name
-    creator_name = None
-    if inst.creator_user_id:
-        creator = db.query(models.User).filter(models.User.id == inst.creator_user_id).first()
-        if creator:
-            creator_name = creator.name
-
-    if user["id"] in pids:
-        return instance_to_dict(inst, tpl, pids, creator_name)
-
-    if inst.current_participants >= tpl.max_participants:
-        raise HTTPException(status_code=400, detail="Quest is full")
-
-    db.add(models.InstanceParticipant(instance_id=instance_id, user_id=user["id"]))
-    inst.current_participants = inst.current_participants + 1
-    # Add to lobby
-    existing_lobby = db.query(models.LobbyParticipant).filter(
-        models.LobbyParticipant.instance_id == instance_id,
-        models.LobbyParticipant.user_id == user["id"],
-    ).first()
-    if not existing_lobby:
-        db.add(models.LobbyParticipant(instance_id=instance_id, user_id=user["id"], is_ready=False, is_host=False))
-    db.commit()
+    count = await take_quest_slot(db, instance_id, user["id"])
+    joined = count is not None
+    if joined:
+        await add_to_lobby(db, instance_id, user["id"])
+        await db.commit()
+        set_committed_value(inst, "current_participants", count)
 
-    pids.append(user["id"])
-    return instance_to_dict(inst, tpl, pids, creator_name)
+    loaded = await db.run_sync(load_instance_dicts, [inst])
+    if not loaded:
+        raise HTTPException(status_code=404, detail="Template not found")
+    if joined:
+        event_bus.publish(events.LOBBY_UPDATED, {"instanceId": instance_id})
+    return loaded[0]
 
 
 # ── Lobby ────────────────────────────────────────────────────────────────────
@@ -1416,18 +2292,10 @@ def _build_lobby_state(db: Session, instance_id: str) -> dict:
     inst = db.query(models.QuestInstance).filter(models.QuestInstance.instance_id == instance_id).first()
     if not inst:
         return None
-    tpl = db.query(models.QuestTemplate).filter(models.QuestTemplate.id == inst.template_id).first()
-    pids = [p.user_id for p in db.query(models.InstanceParticipant).filter(
-        models.InstanceParticipant.instance_id == instance_id).all()]
-
-    # Get creator name
-    creator_name = None
-    if inst.creator_user_id:
-        creator = db.query(models.User).filter(models.User.id == inst.creator_user_id).first()
-        if creator:
-            creator_name = creator.name
-
-    quest_dict = instance_to_dict(inst, tpl, pids, creator_name)
+    loaded = load_instance_dicts(db, [inst])
+    if not loaded:
+        return None
+    quest_dict = loaded[0]
 
     lobby_parts = db.query(models.LobbyParticipant).filter(
         models.LobbyParticipant.instance_id == instance_id).all()
@@ -1438,13 +2306,23 @@ def _build_lobby_state(db: Session, instance_id: str) -> dict:
         if lp.user_id not in seen_user_ids:
             seen_user_ids.add(lp.user_id)
             unique_lobby_parts.append(lp)
+
+    # One query each for names and monsters instead of two per participant
+    user_ids = [lp.user_id for lp in unique_lobby_parts]
+    name_map = {}
+    monster_map = {}
+    if user_ids:
+        name_map = dict(db.query(models.User.id, models.User.name).filter(models.User.id.in_(user_ids)).all())
+        monster_map = {
+            m.user_id: m
+            for m in db.query(models.Monster).filter(models.Monster.user_id.in_(user_ids)).all()
+        }
     participants = []
     for lp in unique_lobby_parts:
-        u = db.query(models.User).filter(models.User.id == lp.user_id).first()
-        m = db.query(models.Monster).filter(models.Monster.user_id == lp.user_id).first()
+        m = monster_map.get(lp.user_id)
         participants.append({
             "id": lp.user_id,
-            "name": u.name if u else "Unknown",
+            "name": name_map.get(lp.user_id, "Unknown"),
             "monster": monster_to_dict(m) if m else {},
             "isReady": lp.is_ready,
             "isHost": lp.is_host,
@@ -1464,96 +2342,222 @@ def _build_lobby_state(db: Session, instance_id: str) -> dict:
     }
 
 
+def _diff_lobby_state(old: dict, new: dict) -> dict:
+    """Return the fields of `new` that differ from `old`, as pushed to lobby sockets.
+
+    Participants are diffed by id into `upserted` and `removed`; an empty
+    dict means nothing changed.
+    """
+    diff = {}
+    for key in ("quest", "allReady", "countdown"):
+        if old.get(key) != new.get(key):
+            diff[key] = new.get(key)
+    old_parts = {p["id"]: p for p in old.get("participants", [])}
+    new_parts = {p["id"]: p for p in new.get("participants", [])}
+    upserted = [p for pid, p in new_parts.items() if old_parts.get(pid) != p]
+    removed = [pid for pid in old_parts if pid not in new_parts]
+    if upserted:
+        diff["upserted"] = upserted
+    if removed:
+        diff["removed"] = removed
+    if upserted or removed:
+        # Lets clients keep the server's participant order without re-sorting
+        diff["order"] = list(new_parts)
+    return diff
+
+
+class LobbyChannel:
+    """WebSocket subscribers per lobby, plus the last state each lobby was sent.
+
+    Mutating endpoints publish `lobby.updated` on the event bus. `run` consumes
+    those events, rebuilds the state once per worker (only for lobbies that
+    have subscribers here) and broadcasts the diff against what subscribers
+    already have.
+    """
+
+    def __init__(self) -> None:
+        self._sockets: dict[str, set[WebSocket]] = {}
+        self._last_state: dict[str, dict] = {}
+
+    def has_subscribers(self, instance_id: str) -> bool:
+        return bool(self._sockets.get(instance_id))
+
+    async def connect(self, instance_id: str, websocket: WebSocket, state: dict) -> None:
+        self._sockets.setdefault(instance_id, set()).add(websocket)
+        self._last_state.setdefault(instance_id, state)
+        await websocket.send_json({"type": "lobby.state", "lobby": state})
+
+    def disconnect(self, instance_id: str, websocket: WebSocket) -> None:
+        sockets = self._sockets.get(instance_id)
+        if not sockets:
+            return
+        sockets.discard(websocket)
+        if not sockets:
+            self._sockets.pop(instance_id, None)
+            self._last_state.pop(instance_id, None)
+
+    async def push_state(self, instance_id: str, state: Optional[dict]) -> None:
+        if not self.has_subscribers(instance_id):
+            return
+        if state is None:
+            await self._broadcast(instance_id, {"type": "lobby.closed", "instanceId": instance_id})
+            return
+        diff = _diff_lobby_state(self._last_state.get(instance_id, {}), state)
+        if not diff:
+            return
+        self._last_state[instance_id] = state
+        await self._broadcast(instance_id, {"type": "lobby.diff", "instanceId": instance_id, **diff})
+
+    async def push_emote(self, instance_id: str, emote: dict) -> None:
+        await self._broadcast(instance_id, {"type": "lobby.emote", **emote})
+
+    async def _broadcast(self, instance_id: str, message: dict) -> None:
+        for websocket in list(self._sockets.get(instance_id, ())):
+            try:
+                await websocket.send_json(message)
+            except Exception:
+                self.disconnect(instance_id, websocket)
+
+    async def run(self) -> None:
+        with event_bus.subscribe(events.LOBBY_UPDATED, events.LOBBY_EMOTE) as sub:
+            async for event in sub:
+                instance_id = event.payload["instanceId"]
+                if not self.has_subscribers(instance_id):
+                    continue
+                try:
+                    if event.topic == events.LOBBY_EMOTE:
+                        await self.push_emote(instance_id, event.payload)
+                    else:
+                        state = await _load_lobby_state(instance_id)
+                        await self.push_state(instance_id, state)
+                except Exception:
+                    logger.exception("Failed to push lobby update for %s", instance_id)
+
+
+lobby_channel = LobbyChannel()
+
+
+async def _load_lobby_state(instance_id: str) -> Optional[dict]:
+    async with AsyncSessionLocal() as db:
+        return await db.run_sync(_build_lobby_state, instance_id)
+
+
+async def _open_lobby_socket(instance_id: str, token: str) -> tuple[Optional[dict], Optional[dict]]:
+    """Authenticate a lobby socket and load its initial state with a short-lived session."""
+    async with AsyncSessionLocal() as db:
+        user = await db.run_sync(user_for_token, token) if token else None
+        if not user:
+            return None, None
+        return user, await db.run_sync(_build_lobby_state, instance_id)
+
+
 @app.get("/api/lobbies/{instance_id}", tags=["Lobby"])
-def get_lobby(instance_id: str, _user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    lobby = _build_lobby_state(db, instance_id)
+async def get_lobby(instance_id: str, _user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    lobby = await db.run_sync(_build_lobby_state, instance_id)
     if not lobby:
         raise HTTPException(status_code=404, detail="Lobby not found")
     return lobby
 
 
+@app.websocket("/ws/lobbies/{instance_id}")
+async def lobby_socket(websocket: WebSocket, instance_id: str, token: str = Query("")):
+    """Push lobby changes instead of having clients poll GET /api/lobbies/{id}.
+
+    Browsers cannot set headers on WebSockets, so the session token is passed
+    as `?token=`. The first message is the full `lobby.state`; after that only
+    `lobby.diff`, `lobby.emote` and `lobby.closed` messages are sent.
+    """
+    await websocket.accept()
+    user, state = await _open_lobby_socket(instance_id, token)
+    if not user:
+        await websocket.close(code=4401, reason="Invalid or expired session token")
+        return
+    if not state:
+        await websocket.close(code=4404, reason="Lobby not found")
+        return
+
+    await lobby_channel.connect(instance_id, websocket, state)
+    try:
+        while True:
+            # Clients only listen; reading keeps the socket open until they go away
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        lobby_channel.disconnect(instance_id, websocket)
+
+
 @app.post("/api/lobbies/{instance_id}/join", tags=["Lobby"])
-def join_lobby(instance_id: str, user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    inst = db.query(models.QuestInstance).filter(models.QuestInstance.instance_id == instance_id).first()
+async def join_lobby(instance_id: str, user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    inst = await db.get(models.QuestInstance, instance_id)
     if not inst:
         raise HTTPException(status_code=404, detail="Instance not found")
 
-    # Ensure quest is joined first
-    existing_p = db.query(models.InstanceParticipant).filter(
-        models.InstanceParticipant.instance_id == instance_id,
-        models.InstanceParticipant.user_id == user["id"],
-    ).first()
-    if not existing_p:
-        tpl = db.query(models.QuestTemplate).filter(models.QuestTemplate.id == inst.template_id).first()
-        if inst.current_participants >= tpl.max_participants:
-            raise HTTPException(status_code=400, detail="Quest is full")
-        db.add(models.InstanceParticipant(instance_id=instance_id, user_id=user["id"]))
-        inst.current_participants = inst.current_participants + 1
-
-    # Add to lobby if not present
-    existing_lobby = db.query(models.LobbyParticipant).filter(
-        models.LobbyParticipant.instance_id == instance_id,
-        models.LobbyParticipant.user_id == user["id"],
-    ).first()
-    if not existing_lobby:
-        db.add(models.LobbyParticipant(instance_id=instance_id, user_id=user["id"], is_ready=False, is_host=False))
-    db.commit()
+    # Ensure quest is joined first, then add to lobby if not present
+    await take_quest_slot(db, instance_id, user["id"])
+    await add_to_lobby(db, instance_id, user["id"])
+    await db.commit()
 
-    lobby = _build_lobby_state(db, instance_id)
+    lobby = await db.run_sync(_build_lobby_state, instance_id)
     if not lobby:
         raise HTTPException(status_code=404, detail="Lobby not found")
+    event_bus.publish(events.LOBBY_UPDATED, {"instanceId": instance_id})
     return lobby
 
 
 @app.put("/api/lobbies/{instance_id}/ready", tags=["Lobby"])
-def toggle_ready(instance_id: str, user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    lp = db.query(models.LobbyParticipant).filter(
+async def toggle_ready(instance_id: str, user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    lp = await db.scalar(select(models.LobbyParticipant).where(
         models.LobbyParticipant.instance_id == instance_id,
         models.LobbyParticipant.user_id == user["id"],
-    ).first()
+    ))
     if not lp:
         raise HTTPException(status_code=400, detail="Not in this lobby")
     lp.is_ready = not lp.is_ready
-    db.commit()
+    await db.commit()
 
-    lobby = _build_lobby_state(db, instance_id)
+    lobby = await db.run_sync(_build_lobby_state, instance_id)
     if not lobby:
         raise HTTPException(status_code=404, detail="Lobby not found")
+    event_bus.publish(events.LOBBY_UPDATED, {"instanceId": instance_id})
     return lobby
 
 
 @app.post("/api/lobbies/{instance_id}/emote", tags=["Lobby"])
-def send_emote(instance_id: str, body: EmoteRequest, user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    inst = db.query(models.QuestInstance).filter(models.QuestInstance.instance_id == instance_id).first()
+async def send_emote(instance_id: str, body: EmoteRequest, user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
+    inst = await db.get(models.QuestInstance, instance_id)
     if not inst:
         raise HTTPException(status_code=404, detail="Lobby not found")
-    return {
-        "ok": True,
+    emote = {
         "emote": body.emote,
         "userId": user["id"],
         "userName": user["name"],
     }
+    event_bus.publish(events.LOBBY_EMOTE, {"instanceId": instance_id, **emote})
+    return {"ok": True, **emote}
 
 
 @app.delete("/api/lobbies/{instance_id}/leave", tags=["Lobby"])
-def leave_lobby(instance_id: str, user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def leave_lobby(instance_id: str, user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
     # Remove from lobby
-    db.query(models.LobbyParticipant).filter(
+    await db.execute(delete(models.LobbyParticipant).where(
         models.LobbyParticipant.instance_id == instance_id,
         models.LobbyParticipant.user_id == user["id"],
-    ).delete()
-    # Remove from instance participants
-    db.query(models.InstanceParticipant).filter(
+    ))
+    # Remove from instance participants and uncount them
+    removed = await db.scalar(delete(models.InstanceParticipant).where(
         models.InstanceParticipant.instance_id == instance_id,
         models.InstanceParticipant.user_id == user["id"],
-    ).delete()
-    # Update participant count
-    inst = db.query(models.QuestInstance).filter(models.QuestInstance.instance_id == instance_id).first()
-    if inst:
-        count = db.query(models.InstanceParticipant).filter(
-            models.InstanceParticipant.instance_id == instance_id).count()
-        inst.current_participants = count
-    db.commit()
+    ).returning(models.InstanceParticipant.id))
+    if removed is not None:
+        await db.execute(update(models.QuestInstance).where(
+            models.QuestInstance.instance_id == instance_id,
+            models.QuestInstance.current_participants > 0,
+        ).values(
+            current_participants=models.QuestInstance.current_participants - 1
+        ).execution_options(synchronize_session=False))
+    await db.commit()
+    event_bus.publish(events.LOBBY_UPDATED, {"instanceId": instance_id})
     return {"ok": True}
 
 
@@ -1604,27 +2608,10 @@ def confirm_checkin(
     crystals_earned = 200
 
     # Update monster
-    m = db.query(models.Monster).filter(models.Monster.user_id == user["id"]).first()
-    if m:
-        m.crystals = m.crystals + crystals_earned
-        m.level = compute_level(m.crystals)
-        m.quests_completed = m.quests_completed + 1
-        m.social_score = m.social_score + (10 if is_group else 3)
-        pqt = dict(m.preferred_quest_types or {})
-        pqt[quest_type] = pqt.get(quest_type, 0) + 1
-        m.preferred_quest_types = pqt
+    settle_quest_rewards(db, [user["id"]], quest_type, crystals_earned, social=10 if is_group else 3)
 
     # Record in quest history
-    db.add(models.QuestHistory(
-        user_id=user["id"],
-        quest_id=quest_id,
-        quest_type=quest_type,
-        start_time=time.time() * 1000,
-        status="completed",
-        group_size=body.participantCount,
-        duration=duration,
-        end_time=time.time() * 1000,
-    ))
+    record_completed_quest(db, [user["id"]], quest_id, quest_type, body.participantCount, duration)
 
     # Mark instance inactive
     if inst:
@@ -1635,29 +2622,7 @@ def confirm_checkin(
         participants = db.query(models.LobbyParticipant).filter(
             models.LobbyParticipant.instance_id == inst.instance_id
         ).all()
-        participant_ids = [p.user_id for p in participants]
-        # Build a name lookup
-        p_users = db.query(models.User).filter(models.User.id.in_(participant_ids)).all()
-        name_map = {u.id: u.name for u in p_users}
-        for pid in participant_ids:
-            for other_pid in participant_ids:
-                if pid == other_pid:
-                    continue
-                # Avoid duplicate connections
-                exists = db.query(models.Connection).filter(
-                    models.Connection.user_id == pid,
-                    models.Connection.connected_user_id == other_pid,
-                ).first()
-                if not exists:
-                    db.add(models.Connection(
-                        id=f"conn_{uuid.uuid4().hex[:8]}",
-                        user_id=pid,
-                        connected_user_id=other_pid,
-                        connected_user_name=name_map.get(other_pid, "Unknown"),
-                        timestamp=time.time(),
-                    ))
-        # Update friends list on User records
-        _add_friends_from_quest(db, participant_ids)
+        connect_participants(db, [p.user_id for p in participants])
 
     db.commit()
 
@@ -1671,53 +2636,310 @@ def confirm_checkin(
     }
 
 
-def upload_to_google_drive(user_id: str, image_bytes: bytes, filename: str, db: Session) -> str:
-    """Upload an image to the user's Google Drive 'BuddyBeasts' folder.
+def decode_image_data(image_data: str) -> bytes:
+    """Bytes of a base64 image, with or without its `data:...;base64,` prefix."""
+    raw = image_data.split(",", 1)[1] if "," in image_data else image_data
+    try:
+        return base64.b64decode(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="imageData must be a base64-encoded image")
+
+
+def _url_signature(path: str, expires: int) -> str:
+    return hmac.new(PHOTO_URL_SECRET.encode(), f"{path}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def signed_url(path: str) -> str:
+    """`path` with an expiry and a signature that `check_url_signature` accepts.
+
+    It expires PHOTO_URL_TTL to twice that from now: the expiry is rounded
+    up so the URL, and the browser's cached copy, stay the same meanwhile.
+    """
+    expires = (int(time.time()) // PHOTO_URL_TTL + 2) * PHOTO_URL_TTL
+    return f"{path}?expires={expires}&sig={_url_signature(path, expires)}"
+
+
+def check_url_signature(path: str, expires: int, sig: str) -> int:
+    """Raise 403 unless `sig` signs (path, expires) and the link is unexpired;
+    returns the seconds it stays valid."""
+    remaining = expires - int(time.time())
+    if remaining <= 0 or not hmac.compare_digest(sig, _url_signature(path, expires)):
+        raise HTTPException(status_code=403, detail="Invalid or expired image link")
+    return remaining
+
+
+def blob_url(image_hash: Optional[str]) -> Optional[str]:
+    """A signed link to a blob, for users who may see the photo it belongs to."""
+    return signed_url(f"/api/blobs/{image_hash}") if image_hash else None
+
+
+def thumbnail_url(photo: models.QuestPhoto, width: int) -> Optional[str]:
+    """URL of the smallest derivative at least `width` pixels wide, or of the
+    original while derivatives are pending or none is wide enough."""
+    wide_enough = [int(w) for w in photo.thumbnails or {} if int(w) >= width]
+    if wide_enough:
+        return blob_url(photo.thumbnails[str(min(wide_enough))])
+    return blob_url(photo.image_hash)
+
+
+# Started in lifespan; spawned rather than forked so workers don't inherit
+# the event loop, DB connections or threads
+_thumbnail_pool: Optional[ProcessPoolExecutor] = None
+
+
+def queue_thumbnails(image_hash: str) -> Optional[Future]:
+    """Render a blob's derivatives in the background. Photos whose job is lost
+    (pool not running, worker crash, shutdown) are re-queued at next startup."""
+    if _thumbnail_pool is None:
+        return None
+    try:
+        future = _thumbnail_pool.submit(render_thumbnails, image_hash)
+    except RuntimeError:
+        logger.exception("Could not queue thumbnails for %s", image_hash)
+        return None
+    future.add_done_callback(lambda f: _save_thumbnails(image_hash, f))
+    return future
+
+
+def _save_thumbnails(image_hash: str, future: Future) -> None:
+    if future.cancelled():
+        return
+    try:
+        thumbnails = future.result()
+    except UnusableImage as exc:
+        # Retrying would not help; record "no derivatives" and serve the original
+        logger.warning("No thumbnails for %s: %s", image_hash, exc)
+        thumbnails = {}
+    except Exception:
+        logger.exception("Thumbnail rendering failed for %s", image_hash)
+        return
+    db = SessionLocal()
+    try:
+        # Every photo of the same image shares the derivatives
+        db.execute(
+            update(models.QuestPhoto)
+            .where(models.QuestPhoto.image_hash == image_hash, models.QuestPhoto.thumbnails.is_(None))
+            .values(thumbnails=thumbnails)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+THUMBNAIL_BACKFILL_LEASE = 300  # seconds; renewed while the backfill waits for its renders
+
+
+def acquire_lease(name: str, ttl: float) -> bool:
+    """Take or renew the job_leases row `name` for this worker; False if
+    another worker holds an unexpired lease. Holds no connection afterwards,
+    so it also works behind a transaction-mode pooler."""
+    now = time.time()
+    stmt = pg_insert(models.JobLease).values(name=name, holder=WORKER_ID, expires_at=now + ttl)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"holder": stmt.excluded.holder, "expires_at": stmt.excluded.expires_at},
+        where=or_(models.JobLease.expires_at < now, models.JobLease.holder == WORKER_ID),
+    ).returning(models.JobLease.name)
+    db = SessionLocal()
+    try:
+        acquired = db.execute(stmt).first() is not None
+        db.commit()
+        return acquired
+    finally:
+        db.close()
+
+
+def release_lease(name: str) -> None:
+    db = SessionLocal()
+    try:
+        db.execute(delete(models.JobLease).where(models.JobLease.name == name, models.JobLease.holder == WORKER_ID))
+        db.commit()
+    finally:
+        db.close()
+
+
+def backfill_thumbnails() -> None:
+    """Queue every stored image that has no derivatives yet and wait for them.
 
-    Returns a publicly viewable Drive URL.
+    Every worker runs this at startup, but only the one holding the
+    "thumbnail_backfill" lease does the work. It renews the lease until its
+    renders finish, so a worker starting meanwhile does not queue the same
+    images again; if it dies, the lease runs out.
     """
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user or not user.google_refresh_token:
-        raise ValueError("No Google refresh token for this user")
-
-    creds = Credentials(
-        token=None,
-        refresh_token=user.google_refresh_token,
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=GOOGLE_CLIENT_ID,
-        client_secret=GOOGLE_CLIENT_SECRET,
+    if not acquire_lease("thumbnail_backfill", THUMBNAIL_BACKFILL_LEASE):
+        return
+    try:
+        db = SessionLocal()
+        try:
+            hashes = db.scalars(
+                select(models.QuestPhoto.image_hash).distinct().where(
+                    models.QuestPhoto.image_hash.isnot(None), models.QuestPhoto.thumbnails.is_(None)
+                )
+            ).all()
+        finally:
+            db.close()
+        pending = {f for f in map(queue_thumbnails, hashes) if f is not None}
+        if pending:
+            logger.info("Queued thumbnails for %d stored photos", len(pending))
+        while pending:
+            _, pending = wait(pending, timeout=THUMBNAIL_BACKFILL_LEASE / 3)
+            if pending:
+                acquire_lease("thumbnail_backfill", THUMBNAIL_BACKFILL_LEASE)
+    finally:
+        release_lease("thumbnail_backfill")
+
+
+@app.get("/api/blobs/{blob_hash}", tags=["Quest Photos"])
+def get_blob(
+    blob_hash: str,
+    expires: int = Query(0),
+    sig: str = Query(""),
+    if_none_match: Optional[str] = Header(None),
+):
+    """Stream a stored image. `<img>` tags cannot send the session token, so
+    instead of auth the link carries a signature from `blob_url`, handed out
+    only with photos the user may see. Browsers may cache the response
+    privately until the link expires."""
+    remaining = check_url_signature(f"/api/blobs/{blob_hash}", expires, sig)
+    if not is_blob_key(blob_hash):
+        raise HTTPException(status_code=404, detail="Blob not found")
+    etag = f'"{blob_hash}"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={remaining}"}
+    if if_none_match and etag in {t.strip().removeprefix("W/") for t in if_none_match.split(",")}:
+        return Response(status_code=304, headers=headers)
+
+    stream = blob_store.open(blob_hash)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    head = stream.read(BLOB_STREAM_CHUNK)
+
+    def chunks():
+        try:
+            yield head
+            while chunk := stream.read(BLOB_STREAM_CHUNK):
+                yield chunk
+        finally:
+            stream.close()
+
+    return StreamingResponse(
+        chunks(), media_type=sniff_media_type(head), headers={**headers, "X-Content-Type-Options": "nosniff"}
     )
 
-    service = build("drive", "v3", credentials=creds)
 
-    # Find or create BuddyBeasts folder
-    query = "name='BuddyBeasts' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-    results = service.files().list(q=query, spaces="drive", fields="files(id)").execute()
-    folders = results.get("files", [])
+def enqueue_drive_upload(db: Session, photo: models.QuestPhoto) -> None:
+    """Add a Drive upload job for a new photo to the session, so it commits
+    together with the photo row."""
+    db.flush()  # the photo row first; there is no relationship to order the inserts
+    now = time.time()
+    db.add(models.DriveUploadJob(
+        id=f"drive_{uuid.uuid4().hex[:12]}",
+        photo_id=photo.id,
+        user_id=photo.user_id,
+        filename=f"quest_{photo.quest_id}_{photo.id}.jpg",
+        status="pending",
+        attempts=0,
+        next_attempt_at=now,
+        created_at=now,
+    ))
 
-    if folders:
-        folder_id = folders[0]["id"]
-    else:
-        folder_meta = {
-            "name": "BuddyBeasts",
-            "mimeType": "application/vnd.google-apps.folder",
-        }
-        folder = service.files().create(body=folder_meta, fields="id").execute()
-        folder_id = folder["id"]
 
-    # Upload the image
-    file_meta = {"name": filename, "parents": [folder_id]}
-    media = MediaInMemoryUpload(image_bytes, mimetype="image/jpeg")
-    uploaded = service.files().create(body=file_meta, media_body=media, fields="id").execute()
-    file_id = uploaded["id"]
+def claim_drive_upload_jobs(limit: int) -> list:
+    """Lease up to `limit` due jobs to this process. SKIP LOCKED lets every
+    worker drain the same table; a job whose worker died is picked up again
+    once its lease runs out."""
+    job = models.DriveUploadJob
+    now = time.time()
+    due = (
+        select(job.id)
+        .where(job.status == "pending", job.next_attempt_at <= now)
+        .order_by(job.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    db = SessionLocal()
+    try:
+        jobs = db.execute(
+            update(job)
+            .where(job.id.in_(due.scalar_subquery()))
+            .values(next_attempt_at=now + DRIVE_UPLOAD_LEASE, attempts=job.attempts + 1)
+            .returning(job.id, job.photo_id, job.user_id, job.filename, job.attempts)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+    finally:
+        db.close()
+    return jobs
+
+
+def drive_retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter, so failed uploads don't retry in lockstep."""
+    delay = min(DRIVE_RETRY_MAX_DELAY, DRIVE_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def run_drive_upload_job(job) -> None:
+    """Upload one claimed job and record the outcome: image_url on success,
+    a later retry on a transient error, status "failed" otherwise."""
+    db = SessionLocal()
+    try:
+        image_hash = db.scalar(select(models.QuestPhoto.image_hash).where(models.QuestPhoto.id == job.photo_id))
+        refresh_token = db.scalar(select(models.User.google_refresh_token).where(models.User.id == job.user_id))
+    finally:
+        # No connection is held during the upload itself
+        db.close()
+
+    image_url, error, retry = None, None, False
+    try:
+        stream = blob_store.open(image_hash) if image_hash else None
+        if stream is None:
+            raise PermanentUploadError("Photo image is missing")
+        with stream:
+            data = stream.read()
+        image_url = drive_uploader.upload(job.user_id, refresh_token, data, job.filename)
+    except PermanentUploadError as exc:
+        error = str(exc)
+    except Exception as exc:
+        error = f"{type(exc).__name__}: {exc}"
+        retry = job.attempts < DRIVE_UPLOAD_MAX_ATTEMPTS
+
+    jobs = models.DriveUploadJob
+    db = SessionLocal()
+    try:
+        if image_url is not None:
+            db.execute(
+                update(models.QuestPhoto).where(models.QuestPhoto.id == job.photo_id).values(image_url=image_url)
+            )
+            db.execute(delete(jobs).where(jobs.id == job.id))
+        elif retry:
+            logger.warning("Drive upload %s failed (attempt %d), will retry: %s", job.id, job.attempts, error)
+            db.execute(
+                update(jobs).where(jobs.id == job.id)
+                .values(next_attempt_at=time.time() + drive_retry_delay(job.attempts), last_error=error)
+            )
+        else:
+            logger.warning("Drive upload %s failed for good after %d attempts: %s", job.id, job.attempts, error)
+            db.execute(update(jobs).where(jobs.id == job.id).values(status="failed", last_error=error))
+        db.commit()
+    finally:
+        db.close()
 
-    # Make publicly viewable
-    service.permissions().create(
-        fileId=file_id,
-        body={"role": "reader", "type": "anyone"},
-    ).execute()
 
-    return f"https://drive.google.com/thumbnail?id={file_id}&sz=w1000"
+async def _run_drive_uploads() -> None:
+    """Drain drive_upload_jobs, DRIVE_UPLOAD_WORKERS uploads at a time. New
+    jobs wake the loop up; retries that come due are found by polling."""
+    with event_bus.subscribe(events.DRIVE_UPLOAD_QUEUED, maxsize=1) as sub:
+        while True:
+            try:
+                jobs = await asyncio.to_thread(claim_drive_upload_jobs, DRIVE_UPLOAD_WORKERS)
+                await asyncio.gather(*(asyncio.to_thread(run_drive_upload_job, job) for job in jobs))
+            except Exception:
+                logger.exception("Drive upload batch failed")
+                jobs = []
+            if not jobs:
+                try:
+                    await asyncio.wait_for(sub.get(), DRIVE_UPLOAD_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
 
 
 @app.post("/api/quests/photos/upload", tags=["Quest Photos"])
@@ -1728,115 +2950,174 @@ def upload_quest_photo(
 ):
     """Upload a group photo after completing a quest."""
     photo_id = f"photo_{uuid.uuid4().hex[:12]}"
-    image_data = body.imageData
+    image_bytes = decode_image_data(body.imageData)
 
-    # Save to DB immediately with base64 so all participants can view the photo
+    # Store the bytes immediately so all participants can view the photo
+    image_hash = blob_store.put(image_bytes)
     photo = models.QuestPhoto(
         id=photo_id,
         quest_id=body.questId,
         user_id=user["id"],
-        image_data=image_data,
+        image_data=None,
+        image_hash=image_hash,
         image_url=None,
         group_memory=body.groupMemory,
         group_size=body.groupSize,
         timestamp=time.time() * 1000,
     )
     db.add(photo)
+    # The Drive copy is made in the background and lands in image_url later;
+    # demo accounts have no Drive
+    drive_queued = not user["id"].startswith("demo_")
+    if drive_queued:
+        enqueue_drive_upload(db, photo)
     db.commit()
-
-    # Best-effort: try Google Drive upload after DB save
-    image_url = None
-    is_demo = user["id"].startswith("demo_")
-    if not is_demo:
-        try:
-            raw = body.imageData
-            if "," in raw:
-                raw = raw.split(",", 1)[1]
-            image_bytes = base64.b64decode(raw)
-            filename = f"quest_{body.questId}_{photo_id}.jpg"
-            image_url = upload_to_google_drive(user["id"], image_bytes, filename, db)
-            photo.image_url = image_url
-            db.commit()
-        except Exception:
-            pass
+    queue_thumbnails(image_hash)
+    if drive_queued:
+        event_bus.publish(events.DRIVE_UPLOAD_QUEUED, {})
 
     return {
         "success": True,
         "photoId": photo_id,
-        "imageUrl": image_url,
-        "imageData": image_data,
+        "imageUrl": None,
+        "driveUploadQueued": drive_queued,
+        "blobUrl": blob_url(image_hash),
         "message": "Photo saved to gallery",
     }
 
 
-@app.get("/api/quests/photos/gallery", tags=["Quest Photos"])
-def get_gallery_photos(
-    user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db),
-):
-    """Get gallery photos from all quests the user has participated in."""
-    # Find all quest instance IDs the user participated in
-    participant_rows = db.query(models.InstanceParticipant).filter(
-        models.InstanceParticipant.user_id == user["id"]
-    ).all()
-    quest_ids = [p.instance_id for p in participant_rows]
-
-    # Also include quests from quest history
-    history_rows = db.query(models.QuestHistory).filter(
-        models.QuestHistory.user_id == user["id"]
-    ).all()
-    quest_ids.extend([h.quest_id for h in history_rows])
-    quest_ids = list(set(quest_ids))
-
-    # Get photos from those quests + photos uploaded by this user
-    if quest_ids:
-        photos = db.query(models.QuestPhoto).filter(
-            (models.QuestPhoto.quest_id.in_(quest_ids)) | (models.QuestPhoto.user_id == user["id"])
-        ).order_by(models.QuestPhoto.timestamp.desc()).all()
-    else:
-        photos = db.query(models.QuestPhoto).filter(
-            models.QuestPhoto.user_id == user["id"]
-        ).order_by(models.QuestPhoto.timestamp.desc()).all()
+def photo_image_url(photo_id: str) -> str:
+    """A signed link to one photo's image, for users who may see the photo."""
+    return signed_url(f"/api/quests/photos/{photo_id}/image")
+
+
+def fetch_gallery_page(
+    db: Session,
+    user_id: str,
+    width: int = GALLERY_THUMB_WIDTH,
+    before_time: Optional[float] = None,
+    before_id: Optional[str] = None,
+    limit: int = GALLERY_PAGE_DEFAULT,
+) -> dict:
+    """One page of the photos a user can see, newest first: photos of quests
+    they joined or completed, and their own uploads.
+
+    A single statement: quest membership is a subquery over
+    instance_participants and quest_history, the uploader's name is joined
+    in, and no image bytes are read. Membership is matched as
+    `quest_id = ANY(ARRAY(...))` rather than `IN (...)`, which Postgres can
+    answer from the (quest_id, timestamp) and (user_id, timestamp) indexes
+    instead of scanning every photo. Pass the previous page's last
+    (timestamp, id) as the cursor to get the next page.
+    """
+    photo = models.QuestPhoto
+    member_quests = union(
+        select(models.InstanceParticipant.instance_id).where(models.InstanceParticipant.user_id == user_id),
+        select(models.QuestHistory.quest_id).where(models.QuestHistory.user_id == user_id),
+    )
+    q = (
+        select(
+            photo.id,
+            photo.quest_id,
+            photo.image_hash,
+            photo.thumbnails,
+            photo.image_data.isnot(None).label("legacy"),
+            photo.image_url,
+            photo.group_memory,
+            photo.group_size,
+            photo.timestamp,
+            models.User.name.label("uploader"),
+        )
+        .outerjoin(models.User, models.User.id == photo.user_id)
+        .where(or_(photo.quest_id == any_(func.array(member_quests.scalar_subquery())), photo.user_id == user_id))
+    )
+    if before_time is not None:
+        q = q.where(tuple_(photo.timestamp, photo.id) < tuple_(before_time, before_id or ""))
+    rows = db.execute(q.order_by(photo.timestamp.desc(), photo.id.desc()).limit(limit + 1)).all()
 
     result = []
-    for photo in photos:
-        uploader = db.query(models.User).filter(models.User.id == photo.user_id).first()
+    for r in rows[:limit]:
+        # Rows not yet moved to the blob store are served one at a time
+        full_url = photo_image_url(r.id) if r.legacy and not r.image_hash else blob_url(r.image_hash)
         result.append({
-            "id": photo.id,
-            "questId": photo.quest_id,
-            "imageData": photo.image_data,
-            "imageUrl": photo.image_url,
-            "groupMemory": photo.group_memory,
-            "groupSize": photo.group_size,
-            "timestamp": photo.timestamp,
-            "uploadedBy": uploader.name if uploader else "Unknown",
+            "id": r.id,
+            "questId": r.quest_id,
+            "blobUrl": full_url,
+            "thumbUrl": thumbnail_url(r, width) if r.image_hash else full_url,
+            "imageUrl": r.image_url,
+            "groupMemory": r.group_memory,
+            "groupSize": r.group_size,
+            "timestamp": r.timestamp,
+            "uploadedBy": r.uploader or "Unknown",
         })
+    return {"photos": result, "hasMore": len(rows) > limit}
 
-    return {"photos": result}
+
+@app.get("/api/quests/photos/gallery", tags=["Quest Photos"])
+def get_gallery_photos(
+    width: int = Query(GALLERY_THUMB_WIDTH, ge=1, description="Tile width in device pixels that thumbUrl must cover"),
+    before_time: Optional[float] = Query(None, description="timestamp of the last photo on the previous page"),
+    before_id: Optional[str] = Query(None, description="id of the last photo on the previous page"),
+    limit: int = Query(GALLERY_PAGE_DEFAULT, ge=1, le=GALLERY_PAGE_MAX),
+    user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Gallery photos from all quests the user has participated in, newest
+    first. Images are referenced by URL, never inlined."""
+    if before_id is not None and before_time is None:
+        raise HTTPException(status_code=400, detail="before_id requires before_time")
+    return fetch_gallery_page(db, user["id"], width, before_time, before_id, limit)
+
+
+@app.get("/api/quests/photos/{photo_id}/image", tags=["Quest Photos"])
+def get_photo_image(photo_id: str, expires: int = Query(0), sig: str = Query(""), db: Session = Depends(get_db)):
+    """The image of one photo. Rows still holding base64 data (see
+    migrate_photos_to_blobs.py) are decoded here; the rest redirect to their
+    blob. `<img>` tags cannot send the session token, so instead of auth the
+    link carries a signature from `photo_image_url`, handed out only to
+    users who may see the photo."""
+    remaining = check_url_signature(f"/api/quests/photos/{photo_id}/image", expires, sig)
+    row = db.execute(
+        select(models.QuestPhoto.image_hash, models.QuestPhoto.image_data).where(models.QuestPhoto.id == photo_id)
+    ).first()
+    if row is None or not (row.image_hash or row.image_data):
+        raise HTTPException(status_code=404, detail="Photo not found")
+    if row.image_hash:
+        # Temporary: the blob link expires, so it must not be cached as the photo's permanent location
+        return RedirectResponse(blob_url(row.image_hash), status_code=307)
+    image_bytes = decode_image_data(row.image_data)
+    return Response(
+        image_bytes,
+        media_type=sniff_media_type(image_bytes[:12]),
+        headers={"Cache-Control": f"private, max-age={remaining}", "X-Content-Type-Options": "nosniff"},
+    )
 
 
 @app.get("/api/quests/{quest_id}/group-photo", tags=["Quest Photos"])
 def get_group_photo(
     quest_id: str,
+    width: int = Query(GALLERY_THUMB_WIDTH, ge=1, description="Display width in device pixels that thumbUrl must cover"),
     user: dict = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """Get the group photo for a quest (uploaded by any participant)."""
-    photo = db.query(models.QuestPhoto).filter(
+    photo = db.query(models.QuestPhoto).options(defer(models.QuestPhoto.image_data)).filter(
         models.QuestPhoto.quest_id == quest_id
     ).order_by(models.QuestPhoto.timestamp.desc()).first()
     
     if photo:
         uploader = db.query(models.User).filter(models.User.id == photo.user_id).first()
         return {
-            "photoData": photo.image_data,
+            "photoData": None if photo.image_hash else photo.image_data,
+            "blobUrl": blob_url(photo.image_hash),
+            "thumbUrl": thumbnail_url(photo, width),
             "imageUrl": photo.image_url,
             "uploadedBy": uploader.name if uploader else "Unknown",
             "groupMemory": photo.group_memory,
             "timestamp": photo.timestamp,
         }
 
-    return {"photoData": None, "imageUrl": None}
+    return {"photoData": None, "blobUrl": None, "thumbUrl": None, "imageUrl": None}
 
 
 @app.post("/api/quests/word-selection", tags=["Quest Photos"])
@@ -2029,54 +3310,16 @@ def complete_quest_with_reaction(
         crystals_earned = 10 * participant_count
         participant_ids = [p.user_id for p in participants]
 
-        for participant_id in participant_ids:
-            m = db.query(models.Monster).filter(models.Monster.user_id == participant_id).first()
-            if m:
-                m.coins = m.coins + coins_earned
-                m.crystals = m.crystals + crystals_earned
-                m.level = compute_level(m.crystals)
-                m.quests_completed = m.quests_completed + 1
-                m.social_score = m.social_score + 10
-                pqt = dict(m.preferred_quest_types or {})
-                pqt[quest_type] = pqt.get(quest_type, 0) + 1
-                m.preferred_quest_types = pqt
-
-            # Record in quest history
-            db.add(models.QuestHistory(
-                user_id=participant_id,
-                quest_id=quest_id,
-                quest_type=quest_type,
-                start_time=time.time() * 1000,
-                status="completed",
-                group_size=len(participants),
-                duration=duration,
-                end_time=time.time() * 1000,
-            ))
+        settle_quest_rewards(db, participant_ids, quest_type, crystals_earned, coins=coins_earned)
+
+        # Record in quest history
+        record_completed_quest(db, participant_ids, quest_id, quest_type, participant_count, duration)
 
         # Mark instance inactive
         inst.is_active = False
 
         # Create Connection records for all quest participants
-        p_users = db.query(models.User).filter(models.User.id.in_(participant_ids)).all()
-        name_map = {u.id: u.name for u in p_users}
-        for pid in participant_ids:
-            for other_pid in participant_ids:
-                if pid == other_pid:
-                    continue
-                exists = db.query(models.Connection).filter(
-                    models.Connection.user_id == pid,
-                    models.Connection.connected_user_id == other_pid,
-                ).first()
-                if not exists:
-                    db.add(models.Connection(
-                        id=f"conn_{uuid.uuid4().hex[:8]}",
-                        user_id=pid,
-                        connected_user_id=other_pid,
-                        connected_user_name=name_map.get(other_pid, "Unknown"),
-                        timestamp=time.time(),
-                    ))
-        # Update friends list on User records
-        _add_friends_from_quest(db, participant_ids)
+        connect_participants(db, participant_ids)
 
         db.commit()
 
@@ -2503,14 +3746,18 @@ def list_connections(user: dict = Depends(get_current_user), db: Session = Depen
 
 @app.post("/api/connections", tags=["Connections"])
 def add_connection(body: AddConnectionRequest, user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    conn = models.Connection(
-        id=f"conn_{uuid.uuid4().hex[:8]}",
+    # Adding an existing connection refreshes its display name and returns it
+    stmt = pg_insert(models.Connection).values(
+        id=f"conn_{uuid.uuid4().hex[:16]}",
         user_id=user["id"],
         connected_user_id=body.connectedUserId,
         connected_user_name=body.connectedUserName,
         timestamp=time.time(),
     )
-    db.add(conn)
+    conn = db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "connected_user_id"],
+        set_={"connected_user_name": stmt.excluded.connected_user_name},
+    ).returning(models.Connection)).scalar_one()
     db.commit()
     return {
         "id": conn.id,
@@ -2584,26 +3831,127 @@ def belonging_trend(user: dict = Depends(get_current_user), db: Session = Depend
 
 # ── Chat ─────────────────────────────────────────────────────────────────────
 
+def fetch_chat_page(
+    db: Session,
+    lobby_id: str,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = CHAT_PAGE_DEFAULT,
+) -> list[dict]:
+    """Keyset page of a lobby's messages on (timestamp, id), returned oldest first.
+
+    `after` gives the messages following that message id, `before` the ones
+    preceding it, and neither the newest page. `limit=None` means no limit.
+    Raises 400 if a cursor id is not a message in this lobby.
+    """
+    key = tuple_(models.ChatMessage.timestamp, models.ChatMessage.id)
+    q = db.query(models.ChatMessage).filter(models.ChatMessage.lobby_id == lobby_id)
+    cursor_id = after or before
+    if cursor_id:
+        cursor = db.query(models.ChatMessage.timestamp).filter(
+            models.ChatMessage.lobby_id == lobby_id,
+            models.ChatMessage.id == cursor_id,
+        ).first()
+        if not cursor:
+            raise HTTPException(status_code=400, detail="Unknown message cursor")
+        cursor_key = tuple_(cursor.timestamp, cursor_id)
+        q = q.filter(key > cursor_key) if after else q.filter(key < cursor_key)
+
+    newest_first = not after
+    if newest_first:
+        q = q.order_by(models.ChatMessage.timestamp.desc(), models.ChatMessage.id.desc())
+    else:
+        q = q.order_by(models.ChatMessage.timestamp.asc(), models.ChatMessage.id.asc())
+    if limit is not None:
+        q = q.limit(limit)
+    rows = q.all()
+    if newest_first:
+        rows.reverse()
+    return [chat_message_to_dict(r) for r in rows]
+
+
 @app.get("/api/chat/{lobby_id}", tags=["Chat"])
-def get_chat_messages(lobby_id: str, _user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    rows = db.query(models.ChatMessage).filter(
-        models.ChatMessage.lobby_id == lobby_id
-    ).order_by(models.ChatMessage.timestamp.asc()).all()
-    return [
-        {
-            "id": r.id,
-            "lobbyId": r.lobby_id,
-            "userId": r.user_id,
-            "userName": r.user_name,
-            "content": r.content,
-            "timestamp": r.timestamp,
-        }
-        for r in rows
-    ]
+async def get_chat_messages(
+    lobby_id: str,
+    before: Optional[str] = Query(None, description="Return messages older than this message id"),
+    after: Optional[str] = Query(None, description="Return messages newer than this message id"),
+    limit: int = Query(CHAT_PAGE_DEFAULT, ge=1, le=CHAT_PAGE_MAX),
+    _user: dict = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """A page of chat history, oldest first. Without a cursor, the newest `limit` messages."""
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'after', not both")
+    return await db.run_sync(fetch_chat_page, lobby_id, before, after, limit)
+
+
+async def _chat_messages_after(lobby_id: str, cursor_id: str) -> Optional[list[dict]]:
+    """The messages in a lobby after `cursor_id`, or None if the cursor is
+    unknown or more than CHAT_PAGE_MAX messages follow it."""
+    async with AsyncSessionLocal() as db:
+        try:
+            messages = await db.run_sync(fetch_chat_page, lobby_id, None, cursor_id, CHAT_PAGE_MAX + 1)
+        except HTTPException:
+            return None
+    return messages if len(messages) <= CHAT_PAGE_MAX else None
+
+
+def _sse_message(message: dict) -> str:
+    return f"id: {message['id']}\nevent: message\ndata: {json.dumps(message)}\n\n"
+
+
+@app.get("/api/chat/{lobby_id}/stream", tags=["Chat"])
+async def stream_chat_messages(
+    lobby_id: str,
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+    after: Optional[str] = Query(None),
+    _user: dict = Depends(get_stream_user),
+):
+    """Server-Sent Events stream of new messages in a lobby or DM.
+
+    Messages after the `Last-Event-ID` header (sent by EventSource on
+    reconnect) or the `after` message id are replayed first, then new
+    messages are streamed as `send_chat_message` writes them. If that id is
+    unknown or more than CHAT_PAGE_MAX messages behind, a `reset` event
+    replaces the replay and the client reloads the newest page instead.
+    """
+    cursor_id = last_event_id or after
+    # Subscribe before replaying so nothing written in between is missed
+    sub = event_bus.subscribe(events.chat_topic(lobby_id))
+
+    async def stream():
+        try:
+            replayed = set()
+            if cursor_id:
+                missed = await _chat_messages_after(lobby_id, cursor_id)
+                if missed is None:
+                    yield "event: reset\ndata: {}\n\n"
+                for message in missed or ():
+                    replayed.add(message["id"])
+                    yield _sse_message(message)
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(sub.get(), CHAT_STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                message = event.payload
+                if message["id"] in replayed:
+                    continue
+                yield _sse_message(message)
+        finally:
+            sub.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/api/chat/{lobby_id}", tags=["Chat"])
-def send_chat_message(lobby_id: str, body: SendMessageRequest, user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def send_chat_message(lobby_id: str, body: SendMessageRequest, user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
     msg = models.ChatMessage(
         id=f"msg_{uuid.uuid4().hex[:8]}",
         lobby_id=lobby_id,
@@ -2613,25 +3961,20 @@ def send_chat_message(lobby_id: str, body: SendMessageRequest, user: dict = Depe
         timestamp=time.time(),
     )
     db.add(msg)
-    db.commit()
-    return {
-        "id": msg.id,
-        "lobbyId": msg.lobby_id,
-        "userId": msg.user_id,
-        "userName": msg.user_name,
-        "content": msg.content,
-        "timestamp": msg.timestamp,
-    }
+    await db.commit()
+    result = chat_message_to_dict(msg)
+    event_bus.publish(events.chat_topic(lobby_id), result)
+    return result
 
 
 @app.post("/api/chat/{lobby_id}/read", tags=["Chat"])
-def mark_chat_read(lobby_id: str, user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def mark_chat_read(lobby_id: str, user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
     """Mark a chat conversation as read by the user"""
     # Check if read status exists
-    read_status = db.query(models.ChatReadStatus).filter(
+    read_status = await db.scalar(select(models.ChatReadStatus).where(
         models.ChatReadStatus.user_id == user["id"],
         models.ChatReadStatus.conversation_id == lobby_id
-    ).first()
+    ))
     
     if read_status:
         read_status.last_read_timestamp = time.time()
@@ -2643,17 +3986,17 @@ def mark_chat_read(lobby_id: str, user: dict = Depends(get_current_user), db: Se
         )
         db.add(read_status)
     
-    db.commit()
+    await db.commit()
     return {"success": True, "lastRead": read_status.last_read_timestamp}
 
 
 @app.get("/api/chat/{lobby_id}/read", tags=["Chat"])
-def get_chat_read_status(lobby_id: str, user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_chat_read_status(lobby_id: str, user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
     """Get when the user last read this conversation"""
-    read_status = db.query(models.ChatReadStatus).filter(
+    read_status = await db.scalar(select(models.ChatReadStatus).where(
         models.ChatReadStatus.user_id == user["id"],
         models.ChatReadStatus.conversation_id == lobby_id
-    ).first()
+    ))
     
     return {
         "lobbyId": lobby_id,
@@ -2662,11 +4005,11 @@ def get_chat_read_status(lobby_id: str, user: dict = Depends(get_current_user),
 
 
 @app.get("/api/chat/read/all", tags=["Chat"])
-def get_all_read_status(user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_all_read_status(user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
     """Get all read statuses for the current user"""
-    statuses = db.query(models.ChatReadStatus).filter(
+    statuses = (await db.scalars(select(models.ChatReadStatus).where(
         models.ChatReadStatus.user_id == user["id"]
-    ).all()
+    ))).all()
     
     return {
         status.conversation_id: status.last_read_timestamp
@@ -2687,59 +4030,85 @@ def _dm_lobby_id(uid1: str, uid2: str) -> str:
     return f"dm_{a}_{b}"
 
 
-def _add_friends_from_quest(db: Session, participant_ids: list[str]):
-    """Add all participants as friends of each other in the users.friends JSON column."""
+def connect_participants(db: Session, participant_ids: list[str]) -> None:
+    """Connect every pair of quest participants, in a constant number of statements.
+
+    All ordered pairs go into one INSERT ... ON CONFLICT DO NOTHING on
+    (user_id, connected_user_id), and the users.friends JSON lists that
+    change are rewritten with one UPDATE.
+    """
+    participant_ids = list(dict.fromkeys(participant_ids))
     if len(participant_ids) < 2:
         return
-    from sqlalchemy.orm.attributes import flag_modified
-    users = db.query(models.User).filter(models.User.id.in_(participant_ids)).all()
+    # Locked in id order: the friends lists are read, then rewritten
+    users = db.query(models.User.id, models.User.name, models.User.friends).filter(
+        models.User.id.in_(participant_ids)
+    ).order_by(models.User.id).with_for_update().all()
     name_map = {u.id: u.name for u in users}
-    user_map = {u.id: u for u in users}
-    for uid in participant_ids:
-        u = user_map.get(uid)
-        if not u:
-            continue
+
+    now = time.time()
+    db.execute(pg_insert(models.Connection).values([
+        {
+            "id": f"conn_{uuid.uuid4().hex[:16]}",
+            "user_id": pid,
+            "connected_user_id": other_pid,
+            "connected_user_name": name_map.get(other_pid, "Unknown"),
+            "timestamp": now,
+        }
+        for pid in name_map
+        for other_pid in participant_ids
+        if other_pid != pid
+    ]).on_conflict_do_nothing(index_elements=["user_id", "connected_user_id"]))
+
+    # Add all participants as friends of each other in the users.friends JSON column
+    changed = []
+    for u in users:
         current_friends = list(u.friends or [])
         existing_ids = {f["id"] for f in current_friends}
-        changed = False
-        for other_id in participant_ids:
-            if other_id != uid and other_id not in existing_ids:
-                current_friends.append({"id": other_id, "name": name_map.get(other_id, "Unknown")})
-                changed = True
-        if changed:
-            u.friends = current_friends
-            flag_modified(u, "friends")
+        added = [
+            {"id": other_id, "name": name_map.get(other_id, "Unknown")}
+            for other_id in participant_ids
+            if other_id != u.id and other_id not in existing_ids
+        ]
+        if added:
+            changed.append((u.id, current_friends + added))
+    if changed:
+        friends = values(column("id", String), column("friends", JSON), name="friends").data(changed)
+        db.execute(
+            update(models.User)
+            .where(models.User.id == friends.c.id)
+            .values(friends=cast(friends.c.friends, JSON))
+            .execution_options(synchronize_session=False)
+        )
 
 
 @app.get("/api/friends", tags=["Chat"])
-def list_friends(user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def list_friends(user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
     """Return the current user's friends list (people they've done quests with)."""
-    u = db.query(models.User).filter(models.User.id == user["id"]).first()
+    u = await db.get(models.User, user["id"])
     if not u:
         return []
     return u.friends or []
 
 
 @app.get("/api/dm/contacts", tags=["Chat"])
-def list_dm_contacts(user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def list_dm_contacts(user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
     """Return DM contacts: friends list from the user record."""
-    u = db.query(models.User).filter(models.User.id == user["id"]).first()
+    u = await db.get(models.User, user["id"])
     if not u:
         return []
     return [{"id": f["id"], "name": f["name"], "source": "friend"} for f in (u.friends or [])]
 
 
 @app.post("/api/dm/start", tags=["Chat"])
-def start_dm(body: StartDMRequest, user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+async def start_dm(body: StartDMRequest, user: dict = Depends(get_current_user_async), db: AsyncSession = Depends(get_async_db)):
     """Create or retrieve a DM conversation between two users."""
     uid1, uid2 = sorted([user["id"], body.targetUserId])
     name1 = user["name"] if uid1 == user["id"] else body.targetUserName
     name2 = body.targetUserName if uid1 == user["id"] else user["name"]
     lobby_id = _dm_lobby_id(uid1, uid2)
 
-    existing = db.query(models.DMConversation).filter(
-        models.DMConversation.id == lobby_id
-    ).first()
+    existing = await db.get(models.DMConversation, lobby_id)
     if existing:
         return {
             "id": existing.id,
@@ -2759,7 +4128,7 @@ def start_dm(body: StartDMRequest, user: dict = Depends(get_current_user), db: S
         created_at=time.time(),
     )
     db.add(dm)
-    db.commit()
+    await db.commit()
     return {
         "id": dm.id,
         "user1Id": dm.user1_id,
@@ -2770,40 +4139,90 @@ def start_dm(body: StartDMRequest, user: dict = Depends(get_current_user), db: S
     }
 
 
-@app.get("/api/dm/conversations", tags=["Chat"])
-def list_dm_conversations(user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    """List all DM conversations for the current user."""
-    from sqlalchemy import or_
-    rows = db.query(models.DMConversation).filter(
-        or_(
-            models.DMConversation.user1_id == user["id"],
-            models.DMConversation.user2_id == user["id"],
+def fetch_dm_inbox(
+    db: Session,
+    user_id: str,
+    before_time: Optional[float] = None,
+    before_id: Optional[str] = None,
+    limit: int = DM_INBOX_PAGE_DEFAULT,
+) -> dict:
+    """One page of a user's DM conversations, most recent activity first.
+
+    A single statement: each conversation is lateral-joined to its newest
+    message and to a count of the other person's messages newer than the
+    user's ChatReadStatus. Activity is the last message time, or the
+    conversation's creation time if it has no messages. Pass the previous
+    page's last (lastMessageTime, id) as the cursor to get the next page.
+    """
+    dm = models.DMConversation
+    msg = models.ChatMessage
+    read = models.ChatReadStatus
+
+    last_msg = (
+        select(msg.content, msg.timestamp, msg.user_id)
+        .where(msg.lobby_id == dm.id)
+        .order_by(msg.timestamp.desc(), msg.id.desc())
+        .limit(1)
+        .lateral("last_msg")
+    )
+    unread = (
+        select(func.count().label("n"))
+        .where(
+            msg.lobby_id == dm.id,
+            msg.user_id != user_id,
+            msg.timestamp > func.coalesce(read.last_read_timestamp, 0),
         )
-    ).all()
+        .lateral("unread")
+    )
+    activity = func.coalesce(last_msg.c.timestamp, dm.created_at)
+
+    q = (
+        db.query(
+            dm,
+            last_msg.c.content,
+            last_msg.c.user_id,
+            activity.label("activity"),
+            unread.c.n,
+        )
+        .outerjoin(read, and_(read.user_id == user_id, read.conversation_id == dm.id))
+        .outerjoin(last_msg, true())
+        .join(unread, true())
+        .filter(or_(dm.user1_id == user_id, dm.user2_id == user_id))
+    )
+    if before_time is not None:
+        q = q.filter(tuple_(activity, dm.id) < tuple_(before_time, before_id or ""))
+    rows = q.order_by(activity.desc(), dm.id.desc()).limit(limit + 1).all()
 
     result = []
-    for r in rows:
-        # Figure out who the *other* person is
-        other_id = r.user2_id if r.user1_id == user["id"] else r.user1_id
-        other_name = r.user2_name if r.user1_id == user["id"] else r.user1_name
-
-        # Get last message preview
-        last_msg = db.query(models.ChatMessage).filter(
-            models.ChatMessage.lobby_id == r.id
-        ).order_by(models.ChatMessage.timestamp.desc()).first()
-
+    for r, content, sender_id, last_activity, unread_count in rows[:limit]:
+        is_user1 = r.user1_id == user_id
         result.append({
             "id": r.id,
-            "otherUserId": other_id,
-            "otherUserName": other_name,
-            "lastMessage": last_msg.content if last_msg else "",
-            "lastMessageTime": last_msg.timestamp if last_msg else r.created_at,
+            "otherUserId": r.user2_id if is_user1 else r.user1_id,
+            "otherUserName": r.user2_name if is_user1 else r.user1_name,
+            "lastMessage": content or "",
+            "lastMessageUserId": sender_id,
+            "lastMessageTime": last_activity,
+            "unreadCount": unread_count,
             "createdAt": r.created_at,
         })
+    return {"conversations": result, "hasMore": len(rows) > limit}
 
-    # Sort by most recent activity
-    result.sort(key=lambda x: x["lastMessageTime"], reverse=True)
-    return result
+
+@app.get("/api/dm/conversations", tags=["Chat"])
+async def list_dm_conversations(
+    before_time: Optional[float] = Query(None, description="lastMessageTime of the last conversation on the previous page"),
+    before_id: Optional[str] = Query(None, description="id of the last conversation on the previous page"),
+    limit: int = Query(DM_INBOX_PAGE_DEFAULT, ge=1, le=DM_INBOX_PAGE_MAX),
+    user: dict = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """DM inbox for the current user: the other person, last message and
+    unread count per conversation, most recent activity first. `hasMore`
+    says whether another page follows."""
+    if before_id is not None and before_time is None:
+        raise HTTPException(status_code=400, detail="before_id requires before_time")
+    return await db.run_sync(fetch_dm_inbox, user["id"], before_time, before_id, limit)
 
 
 # ── Safety ───────────────────────────────────────────────────────────────────
@@ -2834,14 +4253,117 @@ def submit_report(body: SafetyReport, user: dict = Depends(get_current_user), db
 
 # ── Recommendations ──────────────────────────────────────────────────────────
 
+def _time_of_day(start_time: Optional[float]) -> Optional[str]:
+    """Server-local time-of-day bucket of a QuestHistory start_time (ms)."""
+    if not start_time:
+        return None
+    hour = datetime.fromtimestamp(start_time / 1000).hour
+    return "morning" if hour < 12 else ("afternoon" if hour < 17 else "evening")
+
+
+def _count_completion(
+    profile: models.RecommendationProfile, quest_type: str, group_size: Optional[int], start_time: Optional[float]
+) -> None:
+    profile.completed_count = (profile.completed_count or 0) + 1
+    profile.group_size_total = (profile.group_size_total or 0) + (group_size or 2)
+    type_counts = dict(profile.type_counts or {})
+    type_counts[quest_type] = type_counts.get(quest_type, 0) + 1
+    profile.type_counts = type_counts
+    period = _time_of_day(start_time)
+    if period:
+        period_counts = dict(profile.period_counts or {})
+        period_counts[period] = period_counts.get(period, 0) + 1
+        profile.period_counts = period_counts
+
+
+def ensure_recommendation_profiles(db: Session, user_ids: list[str]) -> None:
+    """Create missing RecommendationProfile rows from the users' existing history.
+
+    This is the only place the full history is read; it runs once per user
+    (on their first completion or recommendation request after the table
+    was introduced).
+    """
+    existing = set(db.scalars(
+        select(models.RecommendationProfile.user_id).where(models.RecommendationProfile.user_id.in_(user_ids))
+    ))
+    missing = sorted(set(user_ids) - existing)
+    if not missing:
+        return
+    profiles = {
+        uid: models.RecommendationProfile(user_id=uid, completed_count=0, group_size_total=0, type_counts={}, period_counts={})
+        for uid in missing
+    }
+    rows = db.execute(
+        select(
+            models.QuestHistory.user_id, models.QuestHistory.quest_type,
+            models.QuestHistory.group_size, models.QuestHistory.start_time,
+        ).where(
+            models.QuestHistory.user_id.in_(missing),
+            models.QuestHistory.status == "completed",
+        ).order_by(models.QuestHistory.id)
+    ).all()
+    for user_id, quest_type, group_size, start_time in rows:
+        _count_completion(profiles[user_id], quest_type, group_size, start_time)
+    # A concurrent request may have built the same profile first; both saw the same history
+    db.execute(pg_insert(models.RecommendationProfile).values([
+        {
+            "user_id": p.user_id,
+            "completed_count": p.completed_count,
+            "group_size_total": p.group_size_total,
+            "type_counts": p.type_counts,
+            "period_counts": p.period_counts,
+        }
+        for p in profiles.values()
+    ]).on_conflict_do_nothing(index_elements=["user_id"]))
+
+
+def record_completed_quest(
+    db: Session, user_ids: list[str], quest_id: str, quest_type: str, group_size: int, duration: int
+) -> None:
+    """Add a completed QuestHistory row for each user and count it in their
+    RecommendationProfile, in the caller's transaction and a fixed number of
+    statements."""
+    now_ms = time.time() * 1000
+    ensure_recommendation_profiles(db, user_ids)
+    totals = {
+        "completed_count": models.RecommendationProfile.completed_count + 1,
+        "group_size_total": models.RecommendationProfile.group_size_total + (group_size or 2),
+        "type_counts": json_increment(models.RecommendationProfile.type_counts, quest_type),
+    }
+    period = _time_of_day(now_ms)
+    if period:
+        totals["period_counts"] = json_increment(models.RecommendationProfile.period_counts, period)
+    lock_rows_in_order(db, models.RecommendationProfile.user_id, user_ids)
+    db.execute(
+        update(models.RecommendationProfile)
+        .where(models.RecommendationProfile.user_id.in_(user_ids))
+        .values(**totals)
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(insert(models.QuestHistory), [
+        {
+            "user_id": user_id,
+            "quest_id": quest_id,
+            "quest_type": quest_type,
+            "start_time": now_ms,
+            "status": "completed",
+            "group_size": group_size,
+            "duration": duration,
+            "end_time": now_ms,
+        }
+        for user_id in user_ids
+    ])
+
+
 @app.get("/api/recommendations", response_model=Recommendations, tags=["Recommendations"])
 def get_recommendations(user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    rows = db.query(models.QuestHistory).filter(
-        models.QuestHistory.user_id == user["id"],
-        models.QuestHistory.status == "completed",
-    ).all()
+    profile = db.get(models.RecommendationProfile, user["id"])
+    if profile is None:
+        ensure_recommendation_profiles(db, [user["id"]])
+        db.commit()
+        profile = db.get(models.RecommendationProfile, user["id"])
 
-    if not rows:
+    if not profile.completed_count:
         return {
             "recommendedTypes": ["coffee_chat", "study_jam", "sunset_walk"],
             "recommendedGroupSize": "small",
@@ -2849,15 +4371,13 @@ def get_recommendations(user: dict = Depends(get_current_user), db: Session = De
         }
 
     # Preferred quest types
-    type_count: dict[str, int] = {}
-    for q in rows:
-        type_count[q.quest_type] = type_count.get(q.quest_type, 0) + 1
+    type_count: dict[str, int] = profile.type_counts or {}
     recommended_types = [
         t for t, _ in sorted(type_count.items(), key=lambda x: x[1], reverse=True)
     ][:3]
 
     # Preferred group size
-    avg_group = sum(q.group_size or 2 for q in rows) / len(rows)
+    avg_group = profile.group_size_total / profile.completed_count
     if avg_group <= 2:
         group_size = "1-1"
     elif avg_group <= 4:
@@ -2866,13 +4386,7 @@ def get_recommendations(user: dict = Depends(get_current_user), db: Session = De
         group_size = "large"
 
     # Best time of day
-    hour_counts: dict[str, int] = {}
-    for q in rows:
-        ts = q.start_time
-        if ts:
-            hour = datetime.fromtimestamp(ts / 1000).hour
-            period = "morning" if hour < 12 else ("afternoon" if hour < 17 else "evening")
-            hour_counts[period] = hour_counts.get(period, 0) + 1
+    hour_counts: dict[str, int] = profile.period_counts or {}
     best_time = "afternoon"
     if hour_counts:
         best_time = max(hour_counts, key=hour_counts.get)
@@ -2896,40 +4410,85 @@ def get_trait_recommendations(
     """Return quests scored against the user's personality traits.
     `recommended` = closest match, `comfortZone` = furthest match."""
 
-    monster = db.query(models.Monster).filter(models.Monster.user_id == user["id"]).first()
-    user_traits = monster.trait_scores if monster else None
+    user_traits = db.scalar(select(models.Monster.trait_scores).where(models.Monster.user_id == user["id"]))
     if not user_traits:
         return {"recommended": [], "comfortZone": []}
 
-    # Fetch active quest instances (optionally filtered by hub)
-    q = db.query(models.QuestInstance).filter(models.QuestInstance.is_active == True)
-    if hub_id:
-        q = q.filter(models.QuestInstance.hub_id == hub_id)
-    instances = q.all()
-
-    scored = []
-    for inst in instances:
-        tpl = db.query(models.QuestTemplate).filter(models.QuestTemplate.id == inst.template_id).first()
-        if not tpl:
-            continue
-        dist = compute_trait_distance(user_traits, tpl.type)
-        if dist < 0:
-            continue
-        pids = [p.user_id for p in db.query(models.InstanceParticipant).filter(
-            models.InstanceParticipant.instance_id == inst.instance_id).all()]
-        creator = db.query(models.User).filter(models.User.id == inst.creator_user_id).first()
-        scored.append((dist, instance_to_dict(inst, tpl, pids, creator.name if creator else None)))
+    candidates = scorable_instances(db, hub_id, QUEST_TRAIT_TYPES)
+    if not candidates:
+        return {"recommended": [], "comfortZone": []}
 
-    scored.sort(key=lambda x: x[0])
-    recommended = [item for _, item in scored[:limit]]
+    type_idx = np.fromiter((QUEST_TRAIT_INDEX[t] for _, t in candidates), dtype=np.intp, count=len(candidates))
+    dist = quest_type_distances(user_traits)[type_idx]
+    near, far = nearest_and_farthest(dist, limit)
+    by_id = load_picked_instances(db, [candidates[i][0] for i in np.concatenate((near, far))])
 
     # Comfort zone = furthest distance (opposite of recommended), excluding any already in recommended
-    rec_ids = {item["instanceId"] for item in recommended}
-    comfort_zone = [item for _, item in reversed(scored) if item["instanceId"] not in rec_ids][:limit]
-
+    recommended = [by_id[candidates[i][0]] for i in near if candidates[i][0] in by_id]
+    comfort_zone = [by_id[candidates[i][0]] for i in far if candidates[i][0] in by_id]
     return {"recommended": recommended, "comfortZone": comfort_zone}
 
 
+# ── Collaborative-Filtering Recommendations ──────────────────────────────────
+
+_cf_model: Optional[QuestTypeModel] = None
+_cf_model_loaded_at = -math.inf
+
+
+def current_cf_model(db: Session) -> Optional[QuestTypeModel]:
+    """Factors from the last `python recommender.py` run, reloaded at most
+    every CF_MODEL_TTL seconds; None before the first run."""
+    global _cf_model, _cf_model_loaded_at
+    if time.monotonic() - _cf_model_loaded_at >= CF_MODEL_TTL:
+        _cf_model = QuestTypeModel.load(db)
+        _cf_model_loaded_at = time.monotonic()
+    return _cf_model
+
+
+@app.get("/api/quests/cf-recommendations", tags=["Quests"])
+def get_cf_recommendations(
+    hub_id: Optional[str] = Query(None),
+    limit: int = Query(3, ge=1, le=10),
+    user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Return active quests ranked by the collaborative-filtering model.
+    `basis` is what the ranking used: "embedding" (trained user vector),
+    "history" (the user's completions, for users newer than the last run),
+    "popularity", or null before the model has been trained."""
+    model = current_cf_model(db)
+    if model is None:
+        return {"recommended": [], "basis": None}
+
+    embedding = db.execute(
+        select(models.UserEmbedding.vector, models.UserEmbedding.trained_at)
+        .where(models.UserEmbedding.user_id == user["id"])
+    ).first()
+    if embedding and embedding.trained_at == model.trained_at:
+        user_vector, basis = np.array(embedding.vector, dtype=np.float64), "embedding"
+    else:
+        type_counts = db.scalar(
+            select(models.RecommendationProfile.type_counts).where(models.RecommendationProfile.user_id == user["id"])
+        )
+        user_vector = model.fold_in(type_counts) if type_counts else None
+        basis = "history" if user_vector is not None and user_vector.any() else "popularity"
+
+    candidates = scorable_instances(db, hub_id, model.quest_types)
+    if not candidates:
+        return {"recommended": [], "basis": basis}
+
+    type_idx = np.fromiter((model.index[t] for _, t in candidates), dtype=np.intp, count=len(candidates))
+    scores = model.type_scores(user_vector)[type_idx]
+    best = _k_smallest(-scores, limit)
+    by_id = load_picked_instances(db, [candidates[i][0] for i in best])
+
+    recommended = [
+        {**by_id[candidates[i][0]], "score": round(float(scores[i]), 4)}
+        for i in best if candidates[i][0] in by_id
+    ]
+    return {"recommended": recommended, "basis": basis}
+
+
 # ── Main ─────────────────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Move base64 quest photos from quest_photos.image_data into the blob store."""
+
+import base64
+
+from sqlalchemy import select, update
+
+import models
+from blobstore import blob_store
+from database import SessionLocal
+
+BATCH = 50
+
+moved = skipped = 0
+seen_bad: set[str] = set()
+with SessionLocal() as db:
+    while True:
+        rows = db.execute(
+            select(models.QuestPhoto.id, models.QuestPhoto.image_data)
+            .where(
+                models.QuestPhoto.image_hash.is_(None),
+                models.QuestPhoto.image_data.is_not(None),
+                models.QuestPhoto.id.not_in(seen_bad),
+            )
+            .limit(BATCH)
+        ).all()
+        if not rows:
+            break
+        for photo_id, image_data in rows:
+            raw = image_data.split(",", 1)[1] if "," in image_data else image_data
+            try:
+                image_bytes = base64.b64decode(raw)
+            except ValueError:
+                seen_bad.add(photo_id)
+                skipped += 1
+                print(f"  Skipped {photo_id}: not valid base64")
+                continue
+            db.execute(
+                update(models.QuestPhoto)
+                .where(models.QuestPhoto.id == photo_id)
+                .values(image_hash=blob_store.put(image_bytes), image_data=None)
+            )
+            moved += 1
+        db.commit()
+        print(f"  Moved {moved} photos so far")
+
+print(f"\n✅ Moved {moved} photos to the blob store")
+if skipped:
+    print(f"⚠️  Left {skipped} photos with undecodable image_data in place")
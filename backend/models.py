@@ -3,8 +3,10 @@
 from sqlalchemy import (
     Boolean,
     Column,
+    DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     String,
     Text,
@@ -32,7 +34,14 @@ class Session(Base):
 
     token = Column(String, primary_key=True)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
-    created_at = Column(Float, nullable=True)
+    created_at = Column(Float, nullable=True, index=True)
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String, primary_key=True)  # signed session token logged out before expiry
+    expires_at = Column(Float, nullable=False)
 
 
 class Monster(Base):
@@ -104,18 +113,25 @@ class QuestInstance(Base):
     creator_user_id = Column(String, ForeignKey("users.id"), nullable=True)
     current_participants = Column(Integer, nullable=False, default=0)
     is_active = Column(Boolean, nullable=False, default=True)
-    start_time = Column(String, nullable=True)
+    start_time = Column(DateTime, nullable=True)  # naive, server-local time
     location = Column(String, nullable=True)
     deadline = Column(Float, nullable=True)
 
+    __table_args__ = (Index("ix_quest_instances_active_hub", "is_active", "hub_id"),)
+
 
 class InstanceParticipant(Base):
     __tablename__ = "instance_participants"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    instance_id = Column(String, ForeignKey("quest_instances.instance_id"), nullable=False)
+    instance_id = Column(String, ForeignKey("quest_instances.instance_id"), nullable=False, index=True)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
 
+    __table_args__ = (
+        UniqueConstraint("instance_id", "user_id"),
+        Index("ix_instance_participants_user_instance", "user_id", "instance_id"),
+    )
+
 
 class LobbyParticipant(Base):
     __tablename__ = "lobby_participants"
@@ -126,6 +142,8 @@ class LobbyParticipant(Base):
     is_ready = Column(Boolean, nullable=False, default=False)
     is_host = Column(Boolean, nullable=False, default=False)
 
+    __table_args__ = (UniqueConstraint("instance_id", "user_id"),)
+
 
 class Connection(Base):
     __tablename__ = "connections"
@@ -136,6 +154,8 @@ class Connection(Base):
     connected_user_name = Column(String, nullable=False)
     timestamp = Column(Float, nullable=False)
 
+    __table_args__ = (UniqueConstraint("user_id", "connected_user_id"),)
+
 
 class Notification(Base):
     __tablename__ = "notifications"
@@ -170,6 +190,37 @@ class QuestHistory(Base):
     duration = Column(Integer, nullable=True)
     end_time = Column(Float, nullable=True)
 
+    __table_args__ = (Index("ix_quest_history_user_quest", "user_id", "quest_id"),)
+
+
+# Running totals over a user's completed QuestHistory, updated with every history write
+class RecommendationProfile(Base):
+    __tablename__ = "recommendation_profiles"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    completed_count = Column(Integer, nullable=False, default=0)
+    group_size_total = Column(Integer, nullable=False, default=0)
+    type_counts = Column(JSON, nullable=False, default=dict)  # {quest_type: completions}
+    period_counts = Column(JSON, nullable=False, default=dict)  # {"morning" | "afternoon" | "evening": completions}
+
+
+# Collaborative-filtering factors written by recommender.py; replaced wholesale on each training run
+class UserEmbedding(Base):
+    __tablename__ = "user_embeddings"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    vector = Column(JSON, nullable=False)  # list[float], length = model rank
+    trained_at = Column(Float, nullable=False)
+
+
+class QuestTypeEmbedding(Base):
+    __tablename__ = "quest_type_embeddings"
+
+    quest_type = Column(String, primary_key=True)
+    vector = Column(JSON, nullable=False)  # list[float], length = model rank
+    popularity = Column(Float, nullable=False, default=0.0)  # share of all interactions
+    trained_at = Column(Float, nullable=False)
+
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
@@ -181,6 +232,8 @@ class ChatMessage(Base):
     content = Column(Text, nullable=False)
     timestamp = Column(Float, nullable=False)
 
+    __table_args__ = (Index("ix_chat_messages_lobby_ts_id", "lobby_id", "timestamp", "id"),)
+
 
 class ChatReadStatus(Base):
     __tablename__ = "chat_read_status"
@@ -198,7 +251,7 @@ class DMConversation(Base):
 
     id = Column(String, primary_key=True)
     user1_id = Column(String, ForeignKey("users.id"), nullable=False)
-    user2_id = Column(String, ForeignKey("users.id"), nullable=False)
+    user2_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
     user1_name = Column(String, nullable=False)
     user2_name = Column(String, nullable=False)
     created_at = Column(Float, nullable=False)
@@ -233,12 +286,47 @@ class QuestPhoto(Base):
     id = Column(String, primary_key=True)
     quest_id = Column(String, nullable=False)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
-    image_data = Column(Text, nullable=True)  # base64 encoded image (fallback for demo users)
+    image_data = Column(Text, nullable=True)  # base64 encoded image (legacy rows, see migrate_photos_to_blobs.py)
+    image_hash = Column(String(64), nullable=True)  # blobstore key (SHA-256 of the image bytes)
+    thumbnails = Column(JSON, nullable=True)  # {width: blobstore key} from thumbnails.py; NULL until rendered
     image_url = Column(String, nullable=True)  # Google Drive URL
     group_memory = Column(String, nullable=True)
     group_size = Column(Integer, nullable=False, default=1)
     timestamp = Column(Float, nullable=False)
 
+    __table_args__ = (
+        Index("ix_quest_photos_quest_ts", "quest_id", "timestamp"),
+        Index("ix_quest_photos_user_ts", "user_id", "timestamp"),
+    )
+
+
+# Pending and failed uploads of quest photos to the uploader's Google Drive;
+# a job row is deleted once its upload succeeds
+class DriveUploadJob(Base):
+    __tablename__ = "drive_upload_jobs"
+
+    id = Column(String, primary_key=True)
+    photo_id = Column(String, ForeignKey("quest_photos.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    filename = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # "pending" or "failed"
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(Float, nullable=False)  # pushed forward while a worker holds the job
+    last_error = Column(Text, nullable=True)
+    created_at = Column(Float, nullable=False)
+
+    __table_args__ = (Index("ix_drive_upload_jobs_due", "status", "next_attempt_at"),)
+
+
+# Background jobs that should run on one API worker at a time: the worker
+# whose lease row is unexpired holds the job and renews it while it runs
+class JobLease(Base):
+    __tablename__ = "job_leases"
+
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=False)
+    expires_at = Column(Float, nullable=False)
+
 
 class WordSelection(Base):
     __tablename__ = "word_selections"
@@ -0,0 +1,2 @@
+-- Composite index for keyset-paginated chat history and SSE replay
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_messages_lobby_ts_id ON chat_messages(lobby_id, timestamp, id);
@@ -0,0 +1,14 @@
+-- One connection row per (user, connected user): quest completion inserts every
+-- participant pair with a single INSERT ... ON CONFLICT DO NOTHING.
+
+-- Drop duplicates, keeping the oldest row of each pair
+DELETE FROM connections a USING connections b
+WHERE a.user_id = b.user_id AND a.connected_user_id = b.connected_user_id
+  AND (a.timestamp, a.id) > (b.timestamp, b.id);
+
+DO $$
+BEGIN
+    ALTER TABLE connections
+        ADD CONSTRAINT connections_user_id_connected_user_id_key UNIQUE (user_id, connected_user_id);
+EXCEPTION WHEN duplicate_table OR duplicate_object THEN NULL;
+END $$;
@@ -0,0 +1,3 @@
+-- The DM inbox filters on either side of a conversation; (user1_id, user2_id) is
+-- already covered by the unique constraint, so index the second column too
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_dm_conversations_user2_id ON dm_conversations(user2_id);
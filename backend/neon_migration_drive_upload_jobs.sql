@@ -0,0 +1,16 @@
+-- Durable queue of Google Drive uploads for quest photos, drained by the API's
+-- background workers. Rows are deleted on success; status 'failed' rows stay
+-- for inspection.
+CREATE TABLE IF NOT EXISTS drive_upload_jobs (
+    id VARCHAR PRIMARY KEY,
+    photo_id VARCHAR NOT NULL REFERENCES quest_photos(id) ON DELETE CASCADE,
+    user_id VARCHAR NOT NULL REFERENCES users(id),
+    filename VARCHAR NOT NULL,
+    status VARCHAR NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at DOUBLE PRECISION NOT NULL,
+    last_error TEXT,
+    created_at DOUBLE PRECISION NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_drive_upload_jobs_due ON drive_upload_jobs (status, next_attempt_at);
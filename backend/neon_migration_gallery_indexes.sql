@@ -0,0 +1,6 @@
+-- Keyset-paginated gallery: photos by quest or uploader, newest first, and
+-- the user's quests from participants and history without table scans.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_quest_photos_quest_ts ON quest_photos(quest_id, timestamp);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_quest_photos_user_ts ON quest_photos(user_id, timestamp);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_instance_participants_user_instance ON instance_participants(user_id, instance_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_quest_history_user_quest ON quest_history(user_id, quest_id);
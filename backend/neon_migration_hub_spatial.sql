@@ -0,0 +1,4 @@
+-- Optional: nearest-hub lookups in Postgres (set HUB_SPATIAL_INDEX=earthdistance)
+CREATE EXTENSION IF NOT EXISTS cube;
+CREATE EXTENSION IF NOT EXISTS earthdistance;
+CREATE INDEX IF NOT EXISTS ix_hubs_earth ON hubs USING gist (ll_to_earth(lat, lng));
@@ -0,0 +1,7 @@
+-- Leases for background jobs that should run on one API worker at a time
+-- (e.g. the thumbnail backfill at startup)
+CREATE TABLE IF NOT EXISTS job_leases (
+    name VARCHAR PRIMARY KEY,
+    holder VARCHAR NOT NULL,
+    expires_at DOUBLE PRECISION NOT NULL
+);
@@ -0,0 +1,2 @@
+-- Index participant lookups so quest lists can batch-load participants with IN (...)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_instance_participants_instance_id ON instance_participants(instance_id);
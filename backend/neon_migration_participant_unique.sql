@@ -0,0 +1,28 @@
+-- One participant row per (instance, user): joins insert with ON CONFLICT DO NOTHING
+-- and bump quest_instances.current_participants with a conditional UPDATE.
+
+-- Drop duplicates left by earlier racing joins, keeping the oldest row
+DELETE FROM instance_participants a USING instance_participants b
+WHERE a.instance_id = b.instance_id AND a.user_id = b.user_id AND a.id > b.id;
+
+DELETE FROM lobby_participants a USING lobby_participants b
+WHERE a.instance_id = b.instance_id AND a.user_id = b.user_id AND a.id > b.id;
+
+DO $$
+BEGIN
+    ALTER TABLE instance_participants
+        ADD CONSTRAINT instance_participants_instance_id_user_id_key UNIQUE (instance_id, user_id);
+EXCEPTION WHEN duplicate_table OR duplicate_object THEN NULL;
+END $$;
+
+DO $$
+BEGIN
+    ALTER TABLE lobby_participants
+        ADD CONSTRAINT lobby_participants_instance_id_user_id_key UNIQUE (instance_id, user_id);
+EXCEPTION WHEN duplicate_table OR duplicate_object THEN NULL;
+END $$;
+
+-- Counters are now only ever incremented/decremented; start them from the truth
+UPDATE quest_instances qi SET current_participants = (
+    SELECT count(*) FROM instance_participants p WHERE p.instance_id = qi.instance_id
+);
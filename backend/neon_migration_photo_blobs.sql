@@ -0,0 +1,3 @@
+-- Quest photos move to the content-addressed blob store; rows keep only the key.
+-- Run migrate_photos_to_blobs.py afterwards to move existing base64 images out.
+ALTER TABLE quest_photos ADD COLUMN IF NOT EXISTS image_hash VARCHAR(64) DEFAULT NULL;
@@ -0,0 +1,3 @@
+-- Resized copies of each quest photo, rendered in the background after upload.
+-- NULL means not rendered yet; the API queues those rows at startup.
+ALTER TABLE quest_photos ADD COLUMN IF NOT EXISTS thumbnails JSON DEFAULT NULL;
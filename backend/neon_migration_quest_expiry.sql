@@ -0,0 +1,15 @@
+-- Store quest start times as real timestamps so the expiry sweeper can filter in SQL.
+-- Unparseable legacy strings become NULL.
+CREATE FUNCTION pg_temp.try_timestamp(value TEXT) RETURNS TIMESTAMP LANGUAGE plpgsql AS $$
+BEGIN
+    RETURN value::timestamp;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END $$;
+
+ALTER TABLE quest_instances
+ALTER COLUMN start_time TYPE TIMESTAMP
+USING pg_temp.try_timestamp(start_time);
+
+-- Back the active-quest list and the sweeper's bulk UPDATE
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_quest_instances_active_hub ON quest_instances(is_active, hub_id);
@@ -0,0 +1,9 @@
+-- Per-user running totals behind /api/recommendations. Rows are built from
+-- quest_history on first use, so no backfill is needed here.
+CREATE TABLE IF NOT EXISTS recommendation_profiles (
+    user_id VARCHAR PRIMARY KEY REFERENCES users(id),
+    completed_count INTEGER NOT NULL DEFAULT 0,
+    group_size_total INTEGER NOT NULL DEFAULT 0,
+    type_counts JSON NOT NULL DEFAULT '{}',
+    period_counts JSON NOT NULL DEFAULT '{}'
+);
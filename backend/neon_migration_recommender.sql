@@ -0,0 +1,13 @@
+-- Collaborative-filtering embeddings written by `python recommender.py`
+CREATE TABLE IF NOT EXISTS user_embeddings (
+    user_id VARCHAR PRIMARY KEY REFERENCES users(id),
+    vector JSON NOT NULL,
+    trained_at DOUBLE PRECISION NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS quest_type_embeddings (
+    quest_type VARCHAR PRIMARY KEY,
+    vector JSON NOT NULL,
+    popularity DOUBLE PRECISION NOT NULL DEFAULT 0,
+    trained_at DOUBLE PRECISION NOT NULL
+);
@@ -0,0 +1,7 @@
+-- Expire sessions: index created_at for the periodic purge and track revoked signed tokens
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_sessions_created_at ON sessions(created_at);
+
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+    jti VARCHAR PRIMARY KEY,
+    expires_at DOUBLE PRECISION NOT NULL
+);
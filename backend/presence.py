@@ -0,0 +1,117 @@
+"""Hub presence: who is online in which hub, kept in memory.
+
+Heartbeats only touch this store. `last_active` reaches Postgres in periodic
+batches (`drain_dirty`), and the batches are also shared over the event bus
+so every worker answers "who's online" from its own copy.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Iterable
+
+# (hub_id, user_id, last_active)
+PresenceEntry = tuple[str, str, float]
+
+DEPARTURE_RETENTION = 300.0  # seconds departures are remembered for `changes`
+
+
+class MemoryPresenceStore:
+    """Per-worker presence: hub -> user -> last heartbeat, plus recent
+    arrivals and departures so `changes` can answer incremental polls."""
+
+    def __init__(self) -> None:
+        self._hubs: dict[str, dict[str, float]] = {}
+        # hub -> user -> start of the current online streak
+        self._arrived: dict[str, dict[str, float]] = {}
+        # hub -> user -> when they went offline, kept for DEPARTURE_RETENTION
+        self._departed: dict[str, dict[str, float]] = {}
+        self._dirty: dict[tuple[str, str], float] = {}
+        self._created = time.time()
+        self._lock = threading.Lock()
+
+    def _touch(self, hub_id: str, user_id: str, ts: float, timeout: float) -> bool:
+        members = self._hubs.setdefault(hub_id, {})
+        last = members.get(user_id)
+        if last is not None and ts <= last:
+            return False
+        members[user_id] = ts
+        came_online = last is None or ts - last > timeout
+        if came_online:
+            self._arrived.setdefault(hub_id, {})[user_id] = ts
+            self._departed.get(hub_id, {}).pop(user_id, None)
+        return came_online
+
+    def heartbeat(self, hub_id: str, user_id: str, now: float, timeout: float) -> bool:
+        """Record a heartbeat; True if the user was offline in this hub before."""
+        with self._lock:
+            self._dirty[(hub_id, user_id)] = now
+            return self._touch(hub_id, user_id, now, timeout)
+
+    def leave(self, user_id: str, keep_hub_id: str | None = None) -> None:
+        """Forget a user in every hub except `keep_hub_id`."""
+        now = time.time()
+        with self._lock:
+            for hub_id, members in self._hubs.items():
+                if hub_id != keep_hub_id and members.pop(user_id, None) is not None:
+                    self._arrived.get(hub_id, {}).pop(user_id, None)
+                    self._departed.setdefault(hub_id, {})[user_id] = now
+
+    def online(self, hub_id: str, cutoff: float) -> dict[str, float]:
+        """user_id -> last_active for users seen in a hub since `cutoff`."""
+        with self._lock:
+            return {uid: ts for uid, ts in self._hubs.get(hub_id, {}).items() if ts >= cutoff}
+
+    def changes(self, hub_id: str, since: float, now: float, timeout: float) -> tuple[list[str], list[str]] | None:
+        """(came online, went offline) user ids in a hub after `since`, or None
+        if `since` is older than the departures still remembered."""
+        with self._lock:
+            if since < max(self._created, now - DEPARTURE_RETENTION):
+                return None
+            cutoff = now - timeout
+            members = self._hubs.get(hub_id, {})
+            arrived = self._arrived.get(hub_id, {})
+            came_online = [uid for uid, ts in members.items() if ts >= cutoff and arrived.get(uid, 0.0) > since]
+            went_offline = [uid for uid, t in self._departed.get(hub_id, {}).items() if t > since]
+            # Expired but not yet pruned: offline since last_active + timeout
+            went_offline += [uid for uid, ts in members.items() if ts < cutoff and ts + timeout > since]
+            return came_online, went_offline
+
+    def merge(self, entries: Iterable[PresenceEntry], timeout: float) -> None:
+        """Apply heartbeats seen elsewhere (another worker, or the DB at startup)."""
+        with self._lock:
+            for hub_id, user_id, ts in entries:
+                self._touch(hub_id, user_id, ts, timeout)
+
+    def drain_dirty(self) -> list[PresenceEntry]:
+        """Take the local heartbeats not yet flushed to the DB."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        return [(hub_id, user_id, ts) for (hub_id, user_id), ts in dirty.items()]
+
+    def prune(self, now: float, timeout: float) -> None:
+        """Drop entries not seen within `timeout`, remembering them as departures."""
+        cutoff = now - timeout
+        with self._lock:
+            for hub_id in list(self._hubs):
+                departed = self._departed.setdefault(hub_id, {})
+                arrived = self._arrived.get(hub_id, {})
+                for uid, ts in list(self._hubs[hub_id].items()):
+                    if ts < cutoff:
+                        del self._hubs[hub_id][uid]
+                        arrived.pop(uid, None)
+                        departed[uid] = ts + timeout
+            forget_before = now - DEPARTURE_RETENTION
+            for hub_id in list(self._departed):
+                departed = {uid: t for uid, t in self._departed[hub_id].items() if t >= forget_before}
+                if departed:
+                    self._departed[hub_id] = departed
+                else:
+                    del self._departed[hub_id]
+            for hub_id in [h for h, members in self._hubs.items() if not members]:
+                del self._hubs[hub_id]
+                self._arrived.pop(hub_id, None)
+
+
+presence_store = MemoryPresenceStore()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""Collaborative-filtering quest recommender, trained offline.
+
+Run it as a batch job (e.g. nightly cron):  python recommender.py
+
+The job builds a user x quest-type interaction matrix from completed
+QuestHistory, blends each user's row with the average row of their
+connections, and factorizes it with a truncated SVD. The factors go to
+user_embeddings and quest_type_embeddings. The API only loads those factors
+and takes dot products, so requests do no training work.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from collections.abc import Mapping
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal
+
+CF_RANK = int(os.environ.get("CF_RANK", "8"))
+CF_SOCIAL_WEIGHT = float(os.environ.get("CF_SOCIAL_WEIGHT", "0.3"))  # weight of the connections' average row
+
+
+def interaction_weight(counts: np.ndarray) -> np.ndarray:
+    """Completions -> interaction strength; the tenth coffee chat says less than the first."""
+    return np.log1p(counts)
+
+
+class QuestTypeModel:
+    """Quest-type factors from the last training run, used to score at request time."""
+
+    def __init__(self, quest_types: list[str], vectors: np.ndarray, popularity: np.ndarray, trained_at: float) -> None:
+        self.quest_types = quest_types
+        self.index = {t: i for i, t in enumerate(quest_types)}
+        self.vectors = vectors  # (quest types, rank)
+        self.popularity = popularity
+        self.trained_at = trained_at
+
+    @classmethod
+    def load(cls, db: Session) -> Optional[QuestTypeModel]:
+        rows = db.execute(
+            select(
+                models.QuestTypeEmbedding.quest_type,
+                models.QuestTypeEmbedding.vector,
+                models.QuestTypeEmbedding.popularity,
+                models.QuestTypeEmbedding.trained_at,
+            ).order_by(models.QuestTypeEmbedding.quest_type)
+        ).all()
+        if not rows:
+            return None
+        return cls(
+            [r.quest_type for r in rows],
+            np.array([r.vector for r in rows], dtype=np.float64),
+            np.array([r.popularity for r in rows], dtype=np.float64),
+            max(r.trained_at for r in rows),
+        )
+
+    def fold_in(self, type_counts: Mapping[str, int]) -> np.ndarray:
+        """Embed a user the last run did not see, from their own completion
+        counts (without the connection blend)."""
+        x = np.zeros(len(self.quest_types))
+        for quest_type, count in type_counts.items():
+            i = self.index.get(quest_type)
+            if i is not None:
+                x[i] = count
+        return interaction_weight(x) @ self.vectors
+
+    def type_scores(self, user_vector: Optional[np.ndarray]) -> np.ndarray:
+        """Predicted affinity for every quest type, indexed like `quest_types`.
+        Without a user vector this is plain popularity."""
+        if user_vector is None or not user_vector.any():
+            return self.popularity
+        return self.vectors @ user_vector
+
+
+def build_interactions(db: Session) -> tuple[list[str], list[str], np.ndarray, np.ndarray]:
+    """(user ids, quest types, own interactions, interactions blended with connections)."""
+    counts = db.execute(
+        select(models.QuestHistory.user_id, models.QuestHistory.quest_type, func.count())
+        .where(models.QuestHistory.status == "completed")
+        .group_by(models.QuestHistory.user_id, models.QuestHistory.quest_type)
+    ).all()
+    edges = db.execute(select(models.Connection.user_id, models.Connection.connected_user_id)).all()
+
+    user_ids = sorted({uid for uid, _, _ in counts} | {uid for uid, _ in edges})
+    quest_types = sorted({t for _, t, _ in counts})
+    user_index = {uid: i for i, uid in enumerate(user_ids)}
+    type_index = {t: i for i, t in enumerate(quest_types)}
+
+    own = np.zeros((len(user_ids), len(quest_types)))
+    if counts:
+        rows = np.fromiter((user_index[uid] for uid, _, _ in counts), dtype=np.intp, count=len(counts))
+        cols = np.fromiter((type_index[t] for _, t, _ in counts), dtype=np.intp, count=len(counts))
+        own[rows, cols] = interaction_weight(np.array([n for _, _, n in counts], dtype=np.float64))
+
+    # connected_user_id has no foreign key; edges to unknown users are dropped
+    pairs = [(user_index[a], user_index[b]) for a, b in edges if b in user_index and a != b]
+    blended = own.copy()
+    if pairs:
+        src, dst = np.array(pairs, dtype=np.intp).T
+        neighbours = np.zeros_like(own)
+        np.add.at(neighbours, src, own[dst])
+        degree = np.bincount(src, minlength=len(user_ids))
+        has = degree > 0
+        blended[has] += CF_SOCIAL_WEIGHT * neighbours[has] / degree[has, None]
+    return user_ids, quest_types, own, blended
+
+
+def factorize(matrix: np.ndarray, rank: int) -> tuple[np.ndarray, np.ndarray]:
+    """Truncated SVD, returned as (user factors U*S, quest-type factors V).
+
+    There are only a few dozen quest types, so the SVD is taken exactly
+    from the small types x types Gram matrix instead of the full matrix.
+    """
+    eigenvalues, eigenvectors = np.linalg.eigh(matrix.T @ matrix)
+    keep = [i for i in np.argsort(eigenvalues)[::-1][:rank] if eigenvalues[i] > 1e-9]
+    type_vectors = eigenvectors[:, keep]
+    return matrix @ type_vectors, type_vectors
+
+
+def train(db: Session, rank: int = CF_RANK) -> dict:
+    """Rebuild and store all embeddings in one transaction."""
+    started = time.time()
+    user_ids, quest_types, own, blended = build_interactions(db)
+    user_vectors, type_vectors = factorize(blended, rank)
+    total = own.sum()
+    popularity = own.sum(axis=0) / total if total else np.zeros(len(quest_types))
+
+    db.execute(delete(models.UserEmbedding))
+    db.execute(delete(models.QuestTypeEmbedding))
+    if quest_types:
+        db.execute(insert(models.QuestTypeEmbedding), [
+            {
+                "quest_type": t,
+                "vector": [round(float(v), 6) for v in type_vectors[i]],
+                "popularity": float(popularity[i]),
+                "trained_at": started,
+            }
+            for i, t in enumerate(quest_types)
+        ])
+        db.execute(insert(models.UserEmbedding), [
+            {"user_id": uid, "vector": [round(float(v), 6) for v in user_vectors[i]], "trained_at": started}
+            for i, uid in enumerate(user_ids)
+        ])
+    db.commit()
+    return {
+        "users": len(user_ids),
+        "questTypes": len(quest_types),
+        "rank": type_vectors.shape[1],
+        "seconds": round(time.time() - started, 3),
+    }
+
+
+if __name__ == "__main__":
+    with SessionLocal() as session:
+        stats = train(session)
+    print(
+        f"Trained {stats['rank']}-dim embeddings for {stats['users']} users and "
+        f"{stats['questTypes']} quest types in {stats['seconds']}s"
+    )
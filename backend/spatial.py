@@ -0,0 +1,90 @@
+"""Nearest-hub lookups over a KD-tree of hub coordinates.
+
+Points are stored as 3-D unit vectors, so straight-line (chord) distance
+between them orders exactly like great-circle distance and the tree needs no
+special handling near the poles or the antimeridian.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+from typing import Optional
+
+EARTH_RADIUS_KM = 6371.0  # same sphere as main.haversine
+
+# (point, item id, split axis, left subtree, right subtree)
+_Node = tuple
+
+
+def _unit_vector(lat: float, lng: float) -> tuple[float, float, float]:
+    rlat, rlng = math.radians(lat), math.radians(lng)
+    return (math.cos(rlat) * math.cos(rlng), math.cos(rlat) * math.sin(rlng), math.sin(rlat))
+
+
+def _chord_for_km(km: float) -> float:
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+def _km_for_chord(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+
+class GeoIndex:
+    """Static KD-tree of (id, lat, lng) points; rebuild it when the points change."""
+
+    def __init__(self, points: list[tuple[str, float, float]]) -> None:
+        self._size = len(points)
+        self._root = self._build([(_unit_vector(lat, lng), item_id) for item_id, lat, lng in points], 0)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _build(self, items: list, depth: int) -> Optional[_Node]:
+        if not items:
+            return None
+        axis = depth % 3
+        items.sort(key=lambda it: it[0][axis])
+        mid = len(items) // 2
+        point, item_id = items[mid]
+        return (
+            point,
+            item_id,
+            axis,
+            self._build(items[:mid], depth + 1),
+            self._build(items[mid + 1:], depth + 1),
+        )
+
+    def nearest(
+        self, lat: float, lng: float, limit: Optional[int] = None, radius_km: Optional[float] = None
+    ) -> list[tuple[str, float]]:
+        """(id, distance_km) pairs, closest first, at most `limit` of them and
+        none farther than `radius_km`."""
+        k = self._size if limit is None else min(limit, self._size)
+        if k <= 0:
+            return []
+        target = _unit_vector(lat, lng)
+        max_sq = _chord_for_km(radius_km) ** 2 if radius_km is not None else math.inf
+        best: list[tuple[float, str]] = []  # max-heap of (-squared chord, id)
+
+        def bound() -> float:
+            return -best[0][0] if len(best) == k else max_sq
+
+        def visit(node: Optional[_Node]) -> None:
+            if node is None:
+                return
+            point, item_id, axis, left, right = node
+            d_sq = sum((a - b) ** 2 for a, b in zip(point, target))
+            if d_sq <= bound():
+                if len(best) == k:
+                    heapq.heapreplace(best, (-d_sq, item_id))
+                else:
+                    heapq.heappush(best, (-d_sq, item_id))
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            if diff * diff <= bound():
+                visit(far)
+
+        visit(self._root)
+        return [(item_id, _km_for_chord(math.sqrt(-neg))) for neg, item_id in sorted(best, reverse=True)]
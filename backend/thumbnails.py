@@ -0,0 +1,76 @@
+"""Resized copies of uploaded photos, so the gallery can skip full-size images.
+
+`render_thumbnails` runs in a process pool owned by the API (see
+main.queue_thumbnails). It reads the original from the blob store, decodes it
+once (JPEGs at a reduced DCT scale when that is still large enough) and writes
+one derivative per THUMBNAIL_WIDTHS entry narrower than the original. The
+derivatives are ordinary blobs, so they are served and cached like originals.
+"""
+
+from __future__ import annotations
+
+import io
+import math
+import os
+
+from PIL import Image, ImageOps
+
+from blobstore import blob_store
+
+THUMBNAIL_WIDTHS = tuple(sorted({int(w) for w in os.environ.get("THUMBNAIL_WIDTHS", "320,640,1280").split(",")}))
+THUMBNAIL_FORMAT = os.environ.get("THUMBNAIL_FORMAT", "webp").lower()
+THUMBNAIL_QUALITY = int(os.environ.get("THUMBNAIL_QUALITY", "80"))
+
+if THUMBNAIL_FORMAT not in ("webp", "jpeg"):
+    raise RuntimeError(f"Unknown THUMBNAIL_FORMAT: {THUMBNAIL_FORMAT!r}")
+
+_ORIENTATION_TAG = 0x0112
+_SAVE_OPTIONS = {
+    "webp": {"format": "WEBP", "method": 4},
+    "jpeg": {"format": "JPEG", "optimize": True, "progressive": True},
+}
+
+
+class UnusableImage(Exception):
+    """The blob is missing, not an image Pillow can read, or too large to decode."""
+
+
+def _encode(image: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    image.save(buf, quality=THUMBNAIL_QUALITY, **_SAVE_OPTIONS[THUMBNAIL_FORMAT])
+    return buf.getvalue()
+
+
+def render_thumbnails(image_hash: str) -> dict[str, str]:
+    """Store the derivatives of one blob and return {width: blob key}.
+
+    Empty when the original is no wider than the smallest width.
+    """
+    stream = blob_store.open(image_hash)
+    if stream is None:
+        raise UnusableImage(f"blob {image_hash} is missing")
+    try:
+        with stream, Image.open(stream) as original:
+            encoded = _resize_all(original)
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        raise UnusableImage(f"{type(exc).__name__}: {exc}") from None
+    return {str(width): blob_store.put(data) for width, data in encoded.items()}
+
+
+def _resize_all(original: Image.Image) -> dict[int, bytes]:
+    # Camera photos are often stored sideways with an EXIF rotation
+    sideways = original.getexif().get(_ORIENTATION_TAG) in (5, 6, 7, 8)
+    upright_width = original.height if sideways else original.width
+    widths = [w for w in THUMBNAIL_WIDTHS if w < upright_width]
+    if not widths:
+        return {}
+    scale = widths[-1] / upright_width
+    original.draft("RGB", (math.ceil(original.width * scale), math.ceil(original.height * scale)))
+    image = ImageOps.exif_transpose(original)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    encoded = {}
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        encoded[width] = _encode(image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0))
+    return encoded
@@ -20,6 +20,11 @@ api.interceptors.request.use((config) => {
   return config
 })
 
+// Absolute URL for a backend path such as a photo's blobUrl
+export function apiUrl(path) {
+  return path ? `${api.defaults.baseURL}${path}` : null
+}
+
 // Mark a conversation as read and sync with backend (if available)
 export async function markConversationRead(conversationId) {
   // If you have a backend endpoint, call it here
@@ -13,10 +13,13 @@ export default function Chat() {
     messagesByLobby,
     conversations,
     dmConversations,
+    dmHasMore,
     sendMessage,
+    fetchOlderMessages,
     setCurrentConversation,
     ensureHubConversation,
     fetchDMConversations,
+    fetchMoreDMConversations,
     startDMConversation,
     startPolling,
     stopPolling,
@@ -38,7 +41,9 @@ export default function Chat() {
   const [dmContacts, setDmContacts] = useState([])
   const [dmSearchQuery, setDmSearchQuery] = useState('')
   const [friendsList, setFriendsList] = useState([])
+  const [hasOlderMessages, setHasOlderMessages] = useState(true)
   const [contextMenu, setContextMenu] = useState(null)
+  const [loadingMoreDMs, setLoadingMoreDMs] = useState(false)
   const messagesEndRef = useRef(null)
 
   // Ensure hub conversation exists on mount & load DM conversations + friends
@@ -87,11 +92,32 @@ export default function Chat() {
 
   // Derive messages for current conversation
   const conversationMessages = messagesByLobby[selectedConversation] || []
+  const latestMessageId = conversationMessages[conversationMessages.length - 1]?.id
 
-  // Auto-scroll to latest message
+  // Auto-scroll to latest message (not when older history is prepended)
   useEffect(() => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' })
-  }, [conversationMessages])
+  }, [latestMessageId])
+
+  useEffect(() => {
+    setHasOlderMessages(true)
+  }, [selectedConversation])
+
+  // History is paged 50 at a time; a short page means we reached the beginning
+  const CHAT_PAGE_SIZE = 50
+  const handleLoadOlder = async () => {
+    const count = await fetchOlderMessages(selectedConversation)
+    if (count < CHAT_PAGE_SIZE) setHasOlderMessages(false)
+  }
+
+  const handleLoadMoreDMs = async () => {
+    setLoadingMoreDMs(true)
+    try {
+      await fetchMoreDMConversations()
+    } finally {
+      setLoadingMoreDMs(false)
+    }
+  }
 
   // Mark as read whenever new messages arrive in the active conversation
   useEffect(() => {
@@ -380,6 +406,16 @@ export default function Chat() {
               </p>
             </div>
           )}
+
+          {dmHasMore && (
+            <button
+              onClick={handleLoadMoreDMs}
+              disabled={loadingMoreDMs}
+              className="w-full text-xs font-game text-pixel-blue hover:text-pixel-yellow py-1 disabled:opacity-50"
+            >
+              {loadingMoreDMs ? 'Loading...' : 'Load more conversations'}
+            </button>
+          )}
         </div>
 
         {/* Messages Area */}
@@ -392,6 +428,14 @@ export default function Chat() {
             <>
               {/* Messages */}
               <div className="flex-1 min-h-0 overflow-y-auto mb-4 space-y-3 pixel-card p-4 bg-pixel-dark bg-opacity-50 chat-scroll">
+                {hasOlderMessages && conversationMessages.length >= CHAT_PAGE_SIZE && (
+                  <button
+                    onClick={handleLoadOlder}
+                    className="w-full text-xs font-game text-pixel-blue hover:text-pixel-yellow py-1"
+                  >
+                    Load earlier messages
+                  </button>
+                )}
                 {conversationMessages.length > 0 ? (
                   conversationMessages.map((message) => (
                     <div
@@ -443,6 +487,7 @@ export default function Chat() {
                 <div className="flex gap-2">
                   <input
                     type="text"
+                    maxLength={1000}
                     value={messageText}
                     onChange={(e) => setMessageText(e.target.value)}
                     onKeyPress={(e) => {
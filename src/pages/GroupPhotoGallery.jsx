@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react'
 import { useNavigate } from 'react-router-dom'
-import api from '../api'
+import api, { apiUrl } from '../api'
 
 function fixDriveUrl(url) {
   if (!url) return url
@@ -11,7 +11,12 @@ function fixDriveUrl(url) {
 }
 
 function getPhotoSrc(photo) {
-  return photo.imageData || photo.imageBase64 || fixDriveUrl(photo.imageUrl)
+  return photo.imageData || photo.imageBase64 || apiUrl(photo.blobUrl) || fixDriveUrl(photo.imageUrl)
+}
+
+// Grid tiles use the server-picked thumbnail; the lightbox and download keep the full image
+function getThumbSrc(photo) {
+  return photo.imageData || photo.imageBase64 || apiUrl(photo.thumbUrl) || getPhotoSrc(photo)
 }
 
 export default function GroupPhotoGallery() {
@@ -19,12 +24,15 @@ export default function GroupPhotoGallery() {
   const [photos, setPhotos] = useState([])
   const [loading, setLoading] = useState(true)
   const [selectedPhoto, setSelectedPhoto] = useState(null)
+  const [hasMore, setHasMore] = useState(false)
+  const [loadingMore, setLoadingMore] = useState(false)
 
   useEffect(() => {
     const fetchPhotos = async () => {
       try {
         const { data } = await api.get('/api/quests/photos/gallery')
         setPhotos(data.photos || [])
+        setHasMore(!!data.hasMore)
       } catch (err) {
         console.error('Failed to fetch gallery:', err)
       } finally {
@@ -34,9 +42,26 @@ export default function GroupPhotoGallery() {
     fetchPhotos()
   }, [])
 
+  // Next page, keyed on the last photo shown
+  const handleLoadMore = async () => {
+    const last = photos[photos.length - 1]
+    setLoadingMore(true)
+    try {
+      const { data } = await api.get('/api/quests/photos/gallery', {
+        params: { before_time: last.timestamp, before_id: last.id },
+      })
+      setPhotos((prev) => [...prev, ...(data.photos || [])])
+      setHasMore(!!data.hasMore)
+    } catch (err) {
+      console.error('Failed to fetch more photos:', err)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const handleDownload = (photo) => {
     const src = getPhotoSrc(photo)
-    if (photo.imageUrl) {
+    if (!src.startsWith('data:')) {
       window.open(src, '_blank')
     } else {
       const link = document.createElement('a')
@@ -92,7 +117,7 @@ export default function GroupPhotoGallery() {
           <>
             <div className="mb-4">
               <p className="text-xs text-pixel-light font-game">
-                {photos.length} photo{photos.length !== 1 ? 's' : ''} from your quests
+                {photos.length}{hasMore ? '+' : ''} photo{photos.length !== 1 ? 's' : ''} from your quests
               </p>
             </div>
 
@@ -105,8 +130,9 @@ export default function GroupPhotoGallery() {
                   className="relative group overflow-hidden pixel-card hover:border-pixel-yellow transition-all"
                 >
                   <img
-                    src={getPhotoSrc(photo)}
+                    src={getThumbSrc(photo)}
                     alt="Quest photo"
+                    loading="lazy"
                     className="w-full h-40 object-cover group-hover:opacity-80 transition-opacity"
                   />
                   <div className="absolute inset-0 bg-black bg-opacity-0 group-hover:bg-opacity-40 transition-all flex items-end p-2">
@@ -122,6 +148,18 @@ export default function GroupPhotoGallery() {
               ))}
             </div>
 
+            {hasMore && (
+              <div className="text-center mb-6">
+                <button
+                  onClick={handleLoadMore}
+                  disabled={loadingMore}
+                  className="pixel-button bg-pixel-blue text-white px-6 py-3 disabled:opacity-50"
+                >
+                  {loadingMore ? 'Loading...' : 'Load More'}
+                </button>
+              </div>
+            )}
+
             {/* Lightbox Modal */}
             {selectedPhoto && (
               <div
@@ -15,10 +15,23 @@ const CATEGORY_BG = {
   help: coffeeBg,
 }
 
+// Merge a `lobby.diff` pushed over the lobby WebSocket into the current state
+function applyLobbyDiff(lobby, diff) {
+  const byId = new Map(lobby.participants.map(p => [p.id, p]))
+  ;(diff.removed || []).forEach(id => byId.delete(id))
+  ;(diff.upserted || []).forEach(p => byId.set(p.id, p))
+  const order = diff.order || [...byId.keys()]
+  const next = { ...lobby, participants: order.map(id => byId.get(id)).filter(Boolean) }
+  ;['quest', 'allReady', 'countdown'].forEach(key => {
+    if (key in diff) next[key] = diff[key]
+  })
+  return next
+}
+
 export default function Lobby() {
   const navigate = useNavigate()
   const { questId } = useParams()
-  const { user } = useAuthStore()
+  const { user, token } = useAuthStore()
   const { monster } = useMonsterStore()
 
   const [lobby, setLobby] = useState(null)
@@ -45,16 +58,61 @@ export default function Lobby() {
     }
   }, [questId, navigate])
 
+  const showFloatingEmote = useCallback((emote) => {
+    const id = Date.now() + Math.random()
+    const left = Math.random() * 60 + 20
+    setFloatingEmotes(prev => [...prev, { id, emote, left }])
+    setTimeout(() => {
+      setFloatingEmotes(prev => prev.filter(e => e.id !== id))
+    }, 1500)
+  }, [])
+
   useEffect(() => {
-    // Join the lobby on mount
+    let socket = null
+    let pollInterval = null
+    let unmounted = false
+
+    // Join the lobby on mount, then listen for pushed changes
     api.post(`/api/lobbies/${questId}/join`)
-      .then(() => fetchLobby())
+      .then(({ data }) => {
+        setLobby(data)
+        setLoading(false)
+      })
       .catch(() => fetchLobby())
+      .finally(() => {
+        if (unmounted) return
+        const wsBase = api.defaults.baseURL.replace(/^http/, 'ws')
+        socket = new WebSocket(`${wsBase}/ws/lobbies/${questId}?token=${encodeURIComponent(token || '')}`)
+        socket.onmessage = (event) => {
+          const msg = JSON.parse(event.data)
+          if (msg.type === 'lobby.state') {
+            setLobby(msg.lobby)
+          } else if (msg.type === 'lobby.diff') {
+            setLobby(prev => (prev ? applyLobbyDiff(prev, msg) : prev))
+          } else if (msg.type === 'lobby.emote' && msg.userId !== user?.id) {
+            showFloatingEmote(msg.emote)
+          } else if (msg.type === 'lobby.closed') {
+            navigate('/quests')
+          }
+        }
+        socket.onclose = (event) => {
+          if (unmounted) return
+          if (event.code === 4404) {
+            navigate('/quests')
+            return
+          }
+          // Fall back to polling every 2 seconds if the socket drops
+          fetchLobby()
+          pollInterval = setInterval(fetchLobby, 2000)
+        }
+      })
 
-    // Poll lobby state every 2 seconds
-    const interval = setInterval(fetchLobby, 2000)
-    return () => clearInterval(interval)
-  }, [questId, fetchLobby])
+    return () => {
+      unmounted = true
+      if (socket) socket.close()
+      clearInterval(pollInterval)
+    }
+  }, [questId, token, user?.id, fetchLobby, navigate, showFloatingEmote])
 
   // Separate effect for countdown
   useEffect(() => {
@@ -100,12 +158,7 @@ export default function Lobby() {
   }
 
   const handleEmote = async (emote) => {
-    const id = Date.now() + Math.random()
-    const left = Math.random() * 60 + 20
-    setFloatingEmotes(prev => [...prev, { id, emote, left }])
-    setTimeout(() => {
-      setFloatingEmotes(prev => prev.filter(e => e.id !== id))
-    }, 1500)
+    showFloatingEmote(emote)
     try {
       await api.post(`/api/lobbies/${questId}/emote`, { emote })
     } catch {
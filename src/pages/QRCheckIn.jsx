@@ -3,7 +3,7 @@ import { useNavigate, useParams } from 'react-router-dom'
 import { useAuthStore } from '../stores/authStore'
 import { useMonsterStore } from '../stores/monsterStore'
 import { useChatStore } from '../stores/chatStore'
-import api from '../api'
+import api, { apiUrl } from '../api'
 
 const REACTIONS = ['🎉 Fun', '😊 Chill', '💪 Productive', '🌿 Calm', '⚡ Energizing']
 
@@ -58,8 +58,8 @@ export default function QRCheckIn() {
     const interval = setInterval(async () => {
       try {
         const { data } = await api.get(`/api/quests/${questId}/group-photo`)
-        // Prefer base64 data; fix old Drive URLs if that's all we have
-        let photoSrc = data.photoData || data.imageUrl
+        // Prefer our own copy (legacy base64 or blob); fix old Drive URLs if that's all we have
+        let photoSrc = data.photoData || apiUrl(data.thumbUrl || data.blobUrl) || data.imageUrl
         if (photoSrc && photoSrc.includes('drive.google.com/uc?id=')) {
           const m = photoSrc.match(/drive\.google\.com\/uc\?id=([^&]+)/)
           if (m) photoSrc = `https://drive.google.com/thumbnail?id=${m[1]}&sz=w1000`
@@ -10,8 +10,11 @@ export const useChatStore = create(
       messagesByLobby: {},
       conversations: [],
       dmConversations: [],
+      dmHasMore: false,
       currentConversationId: null,
       pollingInterval: null,
+      messageStream: null,
+      streamLobbyId: null,
       backgroundPollingInterval: null,
       lastReadByLobby: {},
       blockedUsers: [],
@@ -118,33 +121,113 @@ export const useChatStore = create(
         }
       },
 
-      // Poll for new messages every 3 seconds (same pattern as hubStore)
+      // Load the page of messages before the oldest one we have; returns how many arrived
+      fetchOlderMessages: async (lobbyId) => {
+        const existing = get().messagesByLobby[lobbyId] || []
+        if (existing.length === 0) return 0
+        try {
+          const { data } = await api.get(`/api/chat/${lobbyId}`, {
+            params: { before: existing[0].id },
+          })
+          const blockedUsers = get().blockedUsers || []
+          const older = data
+            .filter(msg => !blockedUsers.includes(msg.userId))
+            .map((msg) => ({
+              id: msg.id,
+              conversationId: lobbyId,
+              userId: msg.userId,
+              userName: msg.userName,
+              text: filterProfanity(msg.content),
+              timestamp: new Date(msg.timestamp * 1000).toISOString(),
+            }))
+          set((state) => ({
+            messagesByLobby: {
+              ...state.messagesByLobby,
+              [lobbyId]: [...older, ...(state.messagesByLobby[lobbyId] || [])],
+            },
+          }))
+          return data.length
+        } catch (err) {
+          console.error('Failed to fetch older messages:', err)
+          return 0
+        }
+      },
+
+      // Append a message pushed by the chat stream (skipping ones we already have)
+      receiveMessage: (lobbyId, msg) => {
+        if ((get().blockedUsers || []).includes(msg.userId)) return
+        const message = {
+          id: msg.id,
+          conversationId: lobbyId,
+          userId: msg.userId,
+          userName: msg.userName,
+          text: filterProfanity(msg.content),
+          timestamp: new Date(msg.timestamp * 1000).toISOString(),
+        }
+        set((state) => {
+          const existing = state.messagesByLobby[lobbyId] || []
+          if (existing.some((m) => m.id === message.id)) return state
+          const updateConv = (c) =>
+            c.id === lobbyId
+              ? { ...c, lastMessage: message.text, lastMessageTime: message.timestamp }
+              : c
+          return {
+            messagesByLobby: { ...state.messagesByLobby, [lobbyId]: [...existing, message] },
+            conversations: state.conversations.map(updateConv),
+            dmConversations: state.dmConversations.map(updateConv),
+          }
+        })
+      },
+
+      // Stream new messages for the active conversation over SSE; other
+      // conversations in the sidebar are still refreshed every 3 seconds
       startPolling: (lobbyId) => {
         const { fetchMessages, stopPolling, fetchAllConversationsMessages } = get()
         stopPolling()
-        
-        // Fetch initial messages for selected conversation
-        fetchMessages(lobbyId)
-        
+        set({ streamLobbyId: lobbyId })
+
+        // Load history once, then stream everything after the last message we have
+        fetchMessages(lobbyId).then(() => {
+          // Bail out if the user switched conversations while history was loading
+          if (get().streamLobbyId !== lobbyId || get().messageStream) return
+          const messages = get().messagesByLobby[lobbyId] || []
+          const params = new URLSearchParams({ token: useAuthStore.getState().token || '' })
+          if (messages.length > 0) params.set('after', messages[messages.length - 1].id)
+          const stream = new EventSource(
+            `${api.defaults.baseURL}/api/chat/${lobbyId}/stream?${params}`
+          )
+          stream.addEventListener('message', (event) => {
+            get().receiveMessage(lobbyId, JSON.parse(event.data))
+          })
+          // Too far behind to replay: reload the newest page instead
+          stream.addEventListener('reset', () => {
+            fetchMessages(lobbyId)
+          })
+          set({ messageStream: stream })
+        })
+
         // Also fetch all conversations once initially
         fetchAllConversationsMessages()
-        
+
         const interval = setInterval(() => {
-          // Fetch messages for active conversation (higher priority)
-          fetchMessages(lobbyId)
-          // Also fetch all other conversations to update sidebar
-          fetchAllConversationsMessages()
+          // Refresh the other conversations to update the sidebar
+          fetchAllConversationsMessages(lobbyId)
         }, 3000)
-        
+
         set({ pollingInterval: interval })
       },
 
       stopPolling: () => {
-        const { pollingInterval } = get()
+        const { pollingInterval, messageStream } = get()
+        set({ streamLobbyId: null })
         if (pollingInterval) {
           clearInterval(pollingInterval)
           set({ pollingInterval: null })
         }
+        if (messageStream) {
+          messageStream.close()
+          set({ messageStream: null })
+        }
       },
 
       // Background polling for all conversations (when not on chat page)
@@ -168,11 +251,12 @@ export const useChatStore = create(
         }
       },
 
-      // Fetch messages for all active conversations
-      fetchAllConversationsMessages: async () => {
+      // Fetch messages for all active conversations (optionally skipping a streamed one)
+      fetchAllConversationsMessages: async (excludeId = null) => {
         const state = get()
         const allConversations = [...state.conversations, ...state.dmConversations]
-        
+          .filter((conv) => conv.id !== excludeId)
+
         // Fetch messages for each conversation
         for (const conv of allConversations) {
           try {
@@ -271,29 +355,47 @@ export const useChatStore = create(
 
       // ── Direct Messages ─────────────────────────────────────────
 
-      // Fetch all DM conversations from backend
+      // Fetch all DM conversations from backend, following the inbox cursor
+      // page by page (the sidebar looks up every friend's DM)
+      // Load the newest page of the DM inbox; fetchMoreDMConversations pages back
       fetchDMConversations: async () => {
         try {
           const { data } = await api.get('/api/dm/conversations')
-          const state = get()
-          const currentUserId = useAuthStore.getState().user?.id
-          // Add unread count to each DM conversation
-          const dmsWithUnread = data.map((dm) => {
-            const messages = state.messagesByLobby[dm.id] || []
-            const lastReadTime = state.lastReadByLobby?.[dm.id] || 0
-            const unreadCount = messages.filter(
-              (msg) => 
-                new Date(msg.timestamp).getTime() / 1000 > lastReadTime &&
-                msg.userId !== currentUserId
-            ).length
-            return { ...dm, unreadCount }
-          })
-          set({ dmConversations: dmsWithUnread })
+          const { currentConversationId } = get()
+          // The inbox already carries server-side unread counts
+          const dmsWithUnread = data.conversations.map((dm) =>
+            dm.id === currentConversationId ? { ...dm, unreadCount: 0 } : dm
+          )
+          set({ dmConversations: dmsWithUnread, dmHasMore: !!data.hasMore })
         } catch (err) {
           console.error('Failed to fetch DM conversations:', err)
         }
       },
 
+      // Append the next (older) page of the DM inbox
+      fetchMoreDMConversations: async () => {
+        const existing = get().dmConversations
+        if (existing.length === 0) return
+        const last = existing[existing.length - 1]
+        try {
+          const { data } = await api.get('/api/dm/conversations', {
+            params: { before_time: last.lastMessageTime, before_id: last.id },
+          })
+          set((state) => {
+            const known = new Set(state.dmConversations.map((c) => c.id))
+            return {
+              dmConversations: [
+                ...state.dmConversations,
+                ...data.conversations.filter((c) => !known.has(c.id)),
+              ],
+              dmHasMore: !!data.hasMore,
+            }
+          })
+        } catch (err) {
+          console.error('Failed to fetch more DM conversations:', err)
+        }
+      },
+
       // Start (or retrieve) a DM conversation with another user
       startDMConversation: async (targetUserId, targetUserName) => {
         try {
@@ -344,7 +446,9 @@ export const useChatStore = create(
           })
           
           const updatedDMs = state.dmConversations.map((dm) => {
-            const messages = state.messagesByLobby[dm.id] || []
+            const messages = state.messagesByLobby[dm.id]
+            // Keep the inbox's count until this DM's messages are loaded
+            if (!messages) return dm
             const lastReadTime = state.lastReadByLobby?.[dm.id] || 0
             const unreadCount = messages.filter(
               (msg) => 
@@ -6,6 +6,7 @@ export const useHubStore = create((set, get) => ({
   activeQuests: [],
   completedQuests: [],
   pollingInterval: null,
+  presenceSince: null,
 
   setOnlineUsers: (users) => set({ onlineUsers: users }),
 
@@ -31,10 +32,23 @@ export const useHubStore = create((set, get) => ({
     }
   },
 
+  // Fetch only presence changes since the last poll; the first call (since=0)
+  // comes back as a reset with the full list
   fetchOnlineUsers: async (hubId) => {
     try {
-      const { data } = await api.get(`/api/hubs/${hubId}/users`)
-      set({ onlineUsers: data })
+      const { data } = await api.get(`/api/hubs/${hubId}/users`, {
+        params: { since: get().presenceSince ?? 0 },
+      })
+      set((state) => {
+        if (data.reset) {
+          return { onlineUsers: data.online, presenceSince: data.serverTime }
+        }
+        const changed = new Set([...data.offline, ...data.online.map((u) => u.id)])
+        return {
+          onlineUsers: [...state.onlineUsers.filter((u) => !changed.has(u.id)), ...data.online],
+          presenceSince: data.serverTime,
+        }
+      })
     } catch (err) {
       console.error('Failed to fetch online users:', err)
     }
@@ -44,6 +58,7 @@ export const useHubStore = create((set, get) => ({
   startPolling: (hubId) => {
     const { fetchOnlineUsers, sendHeartbeat, stopPolling } = get()
     stopPolling()
+    set({ presenceSince: null })
     // Send initial heartbeat + fetch
     sendHeartbeat(hubId)
     fetchOnlineUsers(hubId)